@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""announcements.py
+
+Incrementally maintained "nearly sold out" announcement.
+
+The conferences with 1 to ALMOST_SOLD_OUT_SEATS seats left are kept in
+the AlmostSoldOut singleton entity, together with the announcement text,
+which is mirrored in memcache. Seat changes call updateAlmostSoldOut()
+only when a conference crosses the threshold (see crossesThreshold()), so
+getAnnouncement() is up to date without scanning Conferences; the
+set_announcement cron only reconciles the set with a query.
+
+getAnnouncement() reads an instance-local cache first, then memcache,
+then the entity; a missing entity is rebuilt lazily, under the memcache
+lock of readThrough() so concurrent misses compute it once.
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import AlmostSoldOut
+from models import Conference
+
+from cache import LocalCache
+from cache import invalidate
+from cache import readThrough
+
+ALMOST_SOLD_OUT_SEATS = 5
+ALMOST_SOLD_OUT_ID = 'announcement'
+MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
+ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
+                    'are nearly sold out: %s')
+ANNOUNCEMENT_LOCAL_TIME = 5     # seconds an instance serves its own copy
+
+_localAnnouncement = LocalCache('announcement', size=1, ttl=ANNOUNCEMENT_LOCAL_TIME)
+
+
+def isAlmostSoldOut(seats):
+    """Return whether a conference with seats left is nearly sold out."""
+    return seats is not None and 0 < seats <= ALMOST_SOLD_OUT_SEATS
+
+
+def crossesThreshold(seats, delta):
+    """Return whether changing the seats of a conference by delta, to seats,
+    moved it in or out of the nearly sold out set."""
+    return isAlmostSoldOut(seats) != isAlmostSoldOut(seats - delta)
+
+
+def _almostSoldOutKey():
+    return ndb.Key(AlmostSoldOut, ALMOST_SOLD_OUT_ID)
+
+
+def _setConferences(entity, conferences):
+    """Store (key, name) pairs of conferences and their announcement on entity."""
+    entity.conferenceKeys = [key for key, _ in conferences]
+    entity.conferenceNames = [name for _, name in conferences]
+    entity.announcement = ANNOUNCEMENT_TPL % (
+        ', '.join(entity.conferenceNames)) if conferences else ""
+
+
+@ndb.transactional()
+def _storeConference(conf_key, name, almost):
+    """Add (or rename) a conference in the set, or remove it."""
+    entity = _almostSoldOutKey().get() or AlmostSoldOut(key=_almostSoldOutKey())
+    conferences = [(key, other) for key, other in
+                   zip(entity.conferenceKeys, entity.conferenceNames) if key != conf_key]
+    if almost:
+        conferences.append((conf_key, name))
+    _setConferences(entity, conferences)
+    entity.put()
+
+
+@ndb.non_transactional
+def updateAlmostSoldOut(conf_key, name, seats):
+    """Put a conference with seats left in or out of the nearly sold out set.
+
+    Does nothing (besides one get) when the set is already right. It runs
+    outside of any transaction: call_on_commit callbacks (see seats.py)
+    still see the committed transaction as the current one, where any
+    datastore call would fail.
+    """
+    almost = isAlmostSoldOut(seats)
+    entity = _almostSoldOutKey().get()
+    current = dict(zip(entity.conferenceKeys, entity.conferenceNames)) if entity else {}
+    if almost == (conf_key in current) and (not almost or current[conf_key] == name):
+        return
+
+    _storeConference(conf_key, name, almost)
+    invalidate(MEMCACHE_ANNOUNCEMENTS_KEY)
+    _localAnnouncement.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+
+
+def _rebuildAlmostSoldOut():
+    """Store the nearly sold out set computed from the Conferences'
+    (reconciled) seatsAvailable and return the announcement."""
+    confs = Conference.query(ndb.AND(
+        Conference.seatsAvailable <= ALMOST_SOLD_OUT_SEATS,
+        Conference.seatsAvailable > 0)
+    ).fetch(projection=[Conference.name])
+
+    entity = AlmostSoldOut(key=_almostSoldOutKey())
+    _setConferences(entity, [(conf.key, conf.name) for conf in confs])
+    entity.put()
+    return entity.announcement
+
+
+def reconcileAlmostSoldOut():
+    """Rebuild the nearly sold out set and return the announcement; used
+    by the set_announcement cron job."""
+    announcement = _rebuildAlmostSoldOut()
+    invalidate(MEMCACHE_ANNOUNCEMENTS_KEY)
+    _localAnnouncement.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+    return announcement
+
+
+def _loadAnnouncement():
+    """Return the stored announcement, rebuilding a missing entity."""
+    entity = _almostSoldOutKey().get()
+    if entity is None:
+        return _rebuildAlmostSoldOut()
+    return entity.announcement
+
+
+def getAnnouncement():
+    """Return the announcement from the instance, memcache or the entity."""
+    announcement = _localAnnouncement.get(MEMCACHE_ANNOUNCEMENTS_KEY)
+    if announcement is None:
+        announcement = readThrough(MEMCACHE_ANNOUNCEMENTS_KEY, _loadAnnouncement,
+            'announcement')
+        _localAnnouncement.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+    return announcement
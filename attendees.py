@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""attendees.py
+
+Reverse index of Conference attendees.
+
+The user ids registered for a conference are kept in NUM_ATTENDEE_SHARDS
+root ConferenceAttendeeShard entities; a user always lands in the shard
+picked by a hash of its id. The shards are written inside the
+registration transactions, so listing or counting the attendees of a
+conference costs one get_multi instead of a query over every Profile.
+
+"""
+
+import bisect
+import hashlib
+
+from google.appengine.ext import ndb
+
+from models import ConferenceAttendeeShard
+
+# changing it moves users to other shards; existing indexes must be rebuilt
+NUM_ATTENDEE_SHARDS = 10
+
+
+def _shardIndex(userId):
+    """Return the shard of a user id."""
+    return int(hashlib.md5(userId.encode('utf-8')).hexdigest(), 16) % NUM_ATTENDEE_SHARDS
+
+
+def _shardKey(websafeConferenceKey, index):
+    """Return the key of one attendee shard of a conference."""
+    return ndb.Key(ConferenceAttendeeShard, '%s-%d' % (websafeConferenceKey, index))
+
+
+def addAttendees(websafeConferenceKey, userIds):
+    """Add user ids to the attendee index of a conference.
+
+    Call it inside the registration transaction; each shard touched is
+    one more entity group of the (xg) transaction.
+    """
+    byShard = {}
+    for userId in userIds:
+        byShard.setdefault(_shardIndex(userId), set()).add(userId)
+
+    keys = [_shardKey(websafeConferenceKey, index) for index in byShard]
+    changed = []
+    for key, shard, index in zip(keys, ndb.get_multi(keys), byShard):
+        shard = shard or ConferenceAttendeeShard(key=key)
+        new = byShard[index].difference(shard.userIds)
+        if new:
+            shard.userIds.extend(sorted(new))
+            changed.append(shard)
+    ndb.put_multi(changed)
+
+
+def addAttendee(websafeConferenceKey, userId):
+    """Add one user id to the attendee index of a conference."""
+    addAttendees(websafeConferenceKey, [userId])
+
+
+def removeAttendee(websafeConferenceKey, userId):
+    """Remove a user id from the attendee index of a conference."""
+    shard = _shardKey(websafeConferenceKey, _shardIndex(userId)).get()
+    if shard and userId in shard.userIds:
+        shard.userIds.remove(userId)
+        shard.put()
+
+
+def getAttendeeIds(websafeConferenceKey):
+    """Return the sorted user ids registered for a conference."""
+    keys = [_shardKey(websafeConferenceKey, index) for index in range(NUM_ATTENDEE_SHARDS)]
+    userIds = []
+    for shard in ndb.get_multi(keys):
+        if shard:
+            userIds.extend(shard.userIds)
+    return sorted(userIds)
+
+
+def getAttendeePage(websafeConferenceKey, pageSize, start=None):
+    """Return (user ids, next start, count) for a page of the attendees of a
+    conference. Pages walk the shards in order, each shard sorted by user id.
+
+    start is the (shard index, last user id of the previous page) returned
+    as next start, or None for the first page. The first page reads every
+    shard (one get_multi) and counts the attendees. Later pages only read
+    the shards they span, starting at the shard of start, and have no
+    count. The next start is None after the last page.
+    """
+    if start is None:
+        keys = [_shardKey(websafeConferenceKey, index) for index in range(NUM_ATTENDEE_SHARDS)]
+        shards = ndb.get_multi(keys)
+        count = sum(len(shard.userIds) for shard in shards if shard)
+        index, after = 0, None
+    else:
+        shards = None
+        count = None
+        index, after = start
+
+    userIds = []
+    while index < NUM_ATTENDEE_SHARDS:
+        shard = shards[index] if shards else _shardKey(websafeConferenceKey, index).get()
+        shardIds = sorted(shard.userIds) if shard else []
+        if after is not None:
+            shardIds = shardIds[bisect.bisect_right(shardIds, after):]
+        taken = shardIds[:pageSize - len(userIds)]
+        userIds.extend(taken)
+        if len(userIds) == pageSize:
+            if len(taken) < len(shardIds) or index + 1 < NUM_ATTENDEE_SHARDS:
+                return userIds, (index, userIds[-1]), count
+            break
+        index, after = index + 1, None
+    return userIds, None, count
+
+
+def backfillAttendees(profiles):
+    """Index the registrations of profiles stored before the index existed;
+    used by the reindex_profiles migration. Safe to run more than once.
+    """
+    byConference = {}
+    for prof in profiles:
+        for conf_key in prof.conferenceKeysToAttend:
+            byConference.setdefault(conf_key.urlsafe(), []).append(prof.key.id())
+    for wsck, userIds in byConference.items():
+        ndb.transaction(lambda: addAttendees(wsck, userIds), xg=True)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""cache.py
+
+Memcache read-through helpers with stampede protection.
+
+readThrough() returns a cached value or computes it; on a miss only the
+request holding the memcache add()-based lock computes and stores the
+value while the others briefly wait for it. LocalCache keeps hot values
+in the instance for a few seconds, in front of memcache. Hits and misses
+are counted per cache name in-process (see getStats()).
+
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from google.appengine.api import memcache
+
+LOCK_SUFFIX = "_LOCK"
+LOCK_TIME = 10              # seconds a computation may hold the lock
+LOCK_WAIT = 0.05            # seconds between two polls of a locked entry
+LOCK_RETRIES = 5
+# seconds during which add() is rejected after an invalidation, so that a
+# computation started before it cannot store a stale value
+INVALIDATION_LOCK = 1
+
+# (seat shards, JSON encoded form) of conferences; sharded conferences are
+# cached without their seats
+MEMCACHE_CONFERENCE_KEY = "CONFERENCE_FORM_V2_%s"
+MEMCACHE_CONFERENCE_SUMMARY_KEY = "CONFERENCE_SUMMARY_V2_%s"
+CONFERENCE_CACHE_TIME = 600  # seconds
+MEMCACHE_CONFERENCE_QUERY_KEY = "CONFERENCE_QUERY_%s"
+MEMCACHE_CONFERENCE_GENERATION_KEY = "CONFERENCE_GENERATION"
+CONFERENCE_QUERY_CACHE_TIME = 300  # seconds
+MEMCACHE_FEATURED_KEY = "FEATUREDMSG_SPEAKER_%s"
+FEATURED_CACHE_TIME = 3600  # seconds
+
+_stats = collections.defaultdict(int)
+
+
+class LocalCache(object):
+    """In-instance LRU cache of at most size entries, each expiring after
+    ttl seconds.
+
+    Entries are not invalidated on other instances, so keep ttl short.
+    """
+
+    def __init__(self, name, size=100, ttl=10):
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()   # requests share instances (threadsafe)
+
+    def get(self, key):
+        """Return the value of key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                _stats[self.name + '.localMiss'] += 1
+                return None
+            # re-insert as the most recently used entry
+            self._entries[key] = entry
+        _stats[self.name + '.localHit'] += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the least recently used entries."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Drop key from this instance."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop all entries from this instance."""
+        with self._lock:
+            self._entries.clear()
+
+
+def readThrough(key, compute, name, ttl=0):
+    """Return the memcache value of key, computing it with compute() on a miss.
+
+    compute() returning None is not cached.
+    """
+    value = memcache.get(key)
+    if value is not None:
+        _stats[name + '.hit'] += 1
+        return value
+    _stats[name + '.miss'] += 1
+
+    lock_key = key + LOCK_SUFFIX
+    for _ in range(LOCK_RETRIES):
+        if memcache.add(lock_key, 1, time=LOCK_TIME):
+            try:
+                value = compute()
+                if value is not None:
+                    memcache.add(key, value, time=ttl)
+            finally:
+                memcache.delete(lock_key)
+            return value
+        # someone else is computing it; wait for the result
+        time.sleep(LOCK_WAIT)
+        value = memcache.get(key)
+        if value is not None:
+            return value
+
+    logging.warning('cache lock on %s not released, computing anyway', key)
+    return compute()
+
+
+def readThroughMulti(keys, computeMissing, name, ttl=0):
+    """Return {key: value} for keys, reading memcache with one get_multi.
+
+    The misses are computed with a single computeMissing(missingKeys) call
+    returning {key: value}; None values are neither cached nor returned.
+    """
+    values = memcache.get_multi(keys)
+    _stats[name + '.hit'] += len(values)
+
+    missing = [key for key in keys if key not in values]
+    if missing:
+        _stats[name + '.miss'] += len(missing)
+        computed = dict((key, value) for key, value in computeMissing(missing).items()
+                        if value is not None)
+        if computed:
+            memcache.add_multi(computed, time=ttl)
+        values.update(computed)
+    return values
+
+
+def invalidate(*keys):
+    """Drop keys from memcache, rejecting stale re-adds for a short while."""
+    memcache.delete_multi(list(keys), seconds=INVALIDATION_LOCK)
+
+
+def invalidateConference(websafeConferenceKey):
+    """Drop the cached ConferenceForm and summary of a conference."""
+    invalidate(MEMCACHE_CONFERENCE_KEY % websafeConferenceKey,
+               MEMCACHE_CONFERENCE_SUMMARY_KEY % websafeConferenceKey)
+
+
+def conferenceQueryKey(*parts):
+    """Return the memcache key of a conference query, hashing its
+    (JSON serializable, normalized) parts."""
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True)).hexdigest()
+    return MEMCACHE_CONFERENCE_QUERY_KEY % digest
+
+
+def getConferenceQuery(key):
+    """Return (generation, cached result or None) of a conference query.
+
+    Results stored under an older generation than the current one are
+    treated as misses; both are read with one memcache RPC.
+    """
+    values = memcache.get_multi([MEMCACHE_CONFERENCE_GENERATION_KEY, key])
+    generation = values.get(MEMCACHE_CONFERENCE_GENERATION_KEY)
+    if generation is None:
+        # start from the clock so an evicted counter never goes back to
+        # a generation that older entries were stored under
+        memcache.add(MEMCACHE_CONFERENCE_GENERATION_KEY, int(time.time()))
+        generation = memcache.get(MEMCACHE_CONFERENCE_GENERATION_KEY)
+
+    cached = values.get(key)
+    if cached is not None and generation is not None and cached[0] == generation:
+        _stats['conferenceQuery.hit'] += 1
+        return generation, cached[1]
+    _stats['conferenceQuery.miss'] += 1
+    return generation, None
+
+
+def setConferenceQuery(key, generation, result):
+    """Store a conference query result computed under generation."""
+    if generation is not None:
+        memcache.set(key, (generation, result), time=CONFERENCE_QUERY_CACHE_TIME)
+
+
+def bumpConferenceGeneration():
+    """Invalidate every cached conference query."""
+    memcache.incr(MEMCACHE_CONFERENCE_GENERATION_KEY, initial_value=int(time.time()))
+
+
+def getStats():
+    """Return the in-process hit/miss counters."""
+    return dict(_stats)
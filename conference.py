@@ -13,16 +13,20 @@ created by wesc on 2014 apr 21
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
 
 from models import ConflictException
 from models import Profile
@@ -36,14 +40,26 @@ from models import ProfileListForm
 
 from models import ConfSession
 from models import ConfSpeaker
+from models import ConfSpeakerCounter
+from models import SpeakerSession
+from models import FeaturedSpeaker
+from models import FeaturedSpeakerForm
+from models import FeaturedSpeakerForms
+from models import ConferenceKeysForm
 from models import ConfSessionForm
 from models import ConfSessionForms
+from models import ConfSessionSearchForm
 from models import ConfSessionType
 from models import ConferenceForms
 
 from models import ConferenceQueryForm
 from models import ConferenceQueryForms
-from models import TeeShirtSize
+from models import ConferenceView
+from models import RegistrationStatus
+from models import RegistrationTicketForm
+from models import WishlistUpdate
+from models import WishlistUpdateForm
+from models import WishlistUpdateResultForm
 
 
 from settings import WEB_CLIENT_ID
@@ -51,17 +67,65 @@ from settings import ANDROID_CLIENT_ID
 from settings import IOS_CLIENT_ID
 from settings import ANDROID_AUDIENCE
 
-from utils import getUserId
+from context import RequestContext
+
+from forms import CONFERENCE_FORM
+from forms import PROFILE_FORM
+from forms import PROFILE_MINI_FORM
+from forms import SESSION_FORM
+
+from announcements import getAnnouncement
+from announcements import reconcileAlmostSoldOut
+
+from seats import getSeatsAsync
+from seats import releaseSeat
+from seats import reserveSeat
+from seats import resetShards
+from seats import seatsReset
+
+from registrations import queueRegistration
+
+from instrumentation import instrument
+
+from speakers import resolveSpeakers
+
+from attendees import addAttendee
+from attendees import backfillAttendees
+from attendees import NUM_ATTENDEE_SHARDS
+from attendees import getAttendeeIds
+from attendees import getAttendeePage
+from attendees import removeAttendee
+
+from cache import CONFERENCE_CACHE_TIME
+from cache import FEATURED_CACHE_TIME
+from cache import MEMCACHE_FEATURED_KEY
+from cache import MEMCACHE_CONFERENCE_KEY
+from cache import MEMCACHE_CONFERENCE_SUMMARY_KEY
+from cache import bumpConferenceGeneration
+from cache import conferenceQueryKey
+from cache import getConferenceQuery
+from cache import invalidate
+from cache import invalidateConference
+from cache import readThrough
+from cache import readThroughMulti
+from cache import setConferenceQuery
 
 import models
 
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
-MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
-ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
-                    'are nearly sold out: %s')
 MEMCACHE_FEATUREDMSG_KEY = "FEATUREDMSG_SPEAKER"
 FEATURED_SPEAKER_TPL = ('Featured speaker: %s. Follow in the Sessions %s from the Conference: %s')
+# sessions a speaker needs in a conference to be featured
+FEATURED_SPEAKER_MIN_SESSIONS = 2
+# id of the FeaturedSpeaker entity under each Conference
+FEATURED_SPEAKER_ID = 'featured'
+# number of Conferences rewritten per batch when an organizer changes name
+ORGANIZER_NAME_BATCH_SIZE = 100
+# number of Profiles rewritten per reindex_profiles task
+PROFILE_REINDEX_BATCH_SIZE = 100
+# number of Sessions rewritten per reindex_sessions task
+SESSION_REINDEX_BATCH_SIZE = 200
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 DEFAULTS = {
@@ -87,16 +151,40 @@ FIELDS =    {
             'MAX_ATTENDEES': 'maxAttendees',
             }
 
+# upper bound for the number of entities returned by a paginated listing
+MAX_PAGE_SIZE = 100
+
+# ConferenceForm fields returned by the SUMMARY view of listings
+SUMMARY_FIELDS = ('websafeKey', 'name', 'city', 'startDate', 'endDate',
+                  'organizerDisplayName', 'maxAttendees', 'seatsAvailable')
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
 )
 
+CONF_LIST_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    view=messages.EnumField(ConferenceView, 1, default='FULL'),
+)
+
 CONF_POST_REQUEST = endpoints.ResourceContainer(
     ConferenceForm,
     websafeConferenceKey=messages.StringField(1),
 )
 
+ATTENDEES_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
+)
+
+TICKET_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ticket=messages.StringField(1),
+)
+
 ####### Session requests
 
 SESS_POST_REQUEST = endpoints.ResourceContainer(
@@ -104,6 +192,11 @@ SESS_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+SESSIONS_POST_REQUEST = endpoints.ResourceContainer(
+    ConfSessionForms,
+    websafeConferenceKey=messages.StringField(1),
+)
+
 SESSBYTPE_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
@@ -115,6 +208,13 @@ SESSBYSPEAKER_GET_REQUEST = endpoints.ResourceContainer(
     speakerDisplayName=messages.StringField(1)
 )
 
+# most sessions createSessions() accepts, and sessions written per transaction
+MAX_SESSIONS_PER_IMPORT = 1000
+SESSION_BATCH_SIZE = 200
+# speakers per session transaction: with the conference, this stays under
+# the 25 entity group limit of xg transactions
+MAX_SPEAKERS_PER_BATCH = 24
+
 SESS_DEFAULTS = {
     "highlights": '',
     "duration": '00:00',
@@ -129,6 +229,12 @@ WSHL_GET_REQUEST = endpoints.ResourceContainer(
     websafeSessionKey=messages.StringField(1),
 )
 
+MAX_WISHLIST_UPDATE = 100
+# how long updateWishlist requestIds are remembered (and retries are safe)
+WISHLIST_UPDATE_LIFETIME = timedelta(days=1)
+# number of expired WishlistUpdates deleted per delete_wishlist_updates task
+WISHLIST_UPDATE_CLEANUP_BATCH_SIZE = 500
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
@@ -138,33 +244,51 @@ WSHL_GET_REQUEST = endpoints.ResourceContainer(
 class ConferenceApi(remote.Service):
     """Conference API v0.1"""
 
+    def _context(self):
+        """Return the RequestContext of the current request (services are
+        instantiated once per request)."""
+        if getattr(self, '_requestContext', None) is None:
+            self._requestContext = RequestContext()
+        return self._requestContext
+
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
     def _copyConferenceToForm(self, conf, displayName):
         """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
-        return cf
+        return CONFERENCE_FORM.toForm(conf, displayName)
+
+
+    def _copyConferencesToForms(self, conferences, nextPageToken=None):
+        """Return ConferenceForms for conferences, skipping missing (None) ones.
+
+        Organizer names are read from the denormalized organizerDisplayName;
+        Profiles are only fetched (with one get_multi) for conferences
+        created before that property existed.
+        """
+        conferences = [conf for conf in conferences if conf]
+
+        organisers = set(ndb.Key(Profile, conf.organizerUserId) for conf in conferences
+                         if conf.organizerDisplayName is None and conf.organizerUserId)
+        profiles = ndb.get_multi(list(organisers))
+
+        # put display names in a dict for easier fetching
+        names = {}
+        for profile in profiles:
+            if profile:
+                names[profile.key.id()] = profile.displayName
+
+        return ConferenceForms(
+            items=CONFERENCE_FORM.toForms(conferences, names),
+            nextPageToken=nextPageToken
+        )
 
 
     def _createConferenceObject(self, request):
         """Create or update Conference object, returning ConferenceForm/request."""
         # preload necessary data items
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        context = self._context()
+        user = context.user
+        user_id = context.userId
 
         if not request.name:
             raise endpoints.BadRequestException("Conference 'name' field required")
@@ -194,28 +318,36 @@ class ConferenceApi(remote.Service):
             data["seatsAvailable"] = data["maxAttendees"]
         # generate Profile Key based on user ID and Conference
         # ID based on Profile key get Conference key from ID
-        p_key = ndb.Key(Profile, user_id)
-        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
+        # (the id allocation and the organizer lookup run in parallel)
+        p_key = context.profileKey
+        ids_future = Conference.allocate_ids_async(size=1, parent=p_key)
+        prof_future = context.getProfileAsync()
+        c_id = ids_future.get_result()[0]
         c_key = ndb.Key(Conference, c_id, parent=p_key)
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
-
-        # create Conference, send email to organizer confirming
-        # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
+        data['organizerDisplayName'] = request.organizerDisplayName = \
+            getattr(prof_future.get_result(), 'displayName', None)
+
+        # create Conference with its seat counter shards (one put_multi),
+        # send email to organizer confirming creation of Conference while
+        # invalidating cached queries & return (modified) ConferenceForm
+        conf = Conference(**data)
+        shards = resetShards(conf, conf.seatsAvailable, put=False)
+        ndb.put_multi([conf] + shards)
+        seatsReset(conf, conf.seatsAvailable)
+        task_future = taskqueue.Queue().add_async(taskqueue.Task(params={'email': user.email(),
             'conferenceInfo': repr(request)},
             url='/tasks/send_confirmation_email'
-        )
+        ))
+        bumpConferenceGeneration()
+        task_future.get_result()
         return request
 
 
-    @ndb.transactional()
+    @ndb.transactional(xg=True)
     def _updateConferenceObject(self, request):
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        user_id = self._context().userId
 
         # copy ConferenceForm/ProtoRPC Message into dict
         data = {field.name: getattr(request, field.name) for field in request.all_fields()}
@@ -235,6 +367,9 @@ class ConferenceApi(remote.Service):
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
         for field in request.all_fields():
+            # organizer name is kept in sync with the Profile, not the request
+            if field.name == 'organizerDisplayName':
+                continue
             data = getattr(request, field.name)
             # only copy fields where we get data
             if data not in (None, []):
@@ -245,9 +380,17 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
+        # seats are counted by the shards; spread the new value over them
+        if request.seatsAvailable is not None:
+            resetShards(conf, request.seatsAvailable)
+        prof = self._getProfileFromUser()
+        conf.organizerDisplayName = getattr(prof, 'displayName')
         conf.put()
-        prof = ndb.Key(Profile, user_id).get()
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        def onCommit():
+            invalidateConference(request.websafeConferenceKey)
+            bumpConferenceGeneration()
+        ndb.get_context().call_on_commit(onCommit)
+        return self._copyConferenceToForm(conf, conf.organizerDisplayName)
 
 
     @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
@@ -270,33 +413,97 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
+        wsck = request.websafeConferenceKey
+        # serialized ConferenceForm, read through memcache
+        cached = readThrough(MEMCACHE_CONFERENCE_KEY % wsck,
+            lambda: self._encodeConference(wsck), 'conference',
+            ttl=CONFERENCE_CACHE_TIME)
+        # return ConferenceForm (with the current seats)
+        return self._decodeConferences({wsck: cached})[wsck]
+
+
+    def _encodeConference(self, wsck):
+        """Return the cached form (see _cacheableForm()) of a conference;
+        used to fill the getConference() cache.
+        """
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf = ndb.Key(urlsafe=wsck).get()
         if not conf:
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
-        # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+                'No conference found with key: %s' % wsck)
+        return self._cacheableForm(conf, self._copyConferencesToForms([conf]).items[0])
 
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @staticmethod
+    def _cacheableForm(conf, form):
+        """Return (seat shards, JSON encoded form) of conf for memcache.
+
+        The seats of sharded conferences change with every registration,
+        so they are left out and read from the seat counter when the form
+        is served (see _decodeConferences()); cached forms then only need
+        invalidating when the Conference itself changes.
+        """
+        if conf.seatShards:
+            form.seatsAvailable = None
+        return conf.seatShards, protojson.encode_message(form)
+
+
+    @staticmethod
+    def _decodeConferences(cached):
+        """Return {wsck: ConferenceForm} for cached ({wsck: cached form}),
+        filling in the seats of sharded conferences (all looked up in one
+        memcache batch).
+        """
+        forms = {}
+        seats = []
+        for wsck, (seatShards, data) in cached.items():
+            forms[wsck] = protojson.decode_message(ConferenceForm, data)
+            if seatShards:
+                seats.append((wsck, getSeatsAsync(ndb.Key(urlsafe=wsck), seatShards)))
+        for wsck, future in seats:
+            forms[wsck].seatsAvailable = future.get_result()
+        return forms
+
+
+    @endpoints.method(CONF_LIST_REQUEST, ConferenceForms,
             path='getConferencesCreated',
             http_method='POST', name='getConferencesCreated')
     def getConferencesCreated(self, request):
-        """Return conferences created by user."""
+        """Return conferences created by user (view=SUMMARY for list fields only)."""
         # make sure user is authed
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
-
         # create ancestor query for all key matches for this user
-        confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = ndb.Key(Profile, user_id).get()
+        confs = Conference.query(ancestor=self._context().profileKey)
+        if request.view == ConferenceView.SUMMARY:
+            return self._summariesToForms(
+                [key.urlsafe() for key in confs.fetch(keys_only=True)])
         # return set of ConferenceForm objects per Conference
+        return self._copyConferencesToForms(confs.fetch())
+
+
+    def _summariesToForms(self, wscks, nextPageToken=None):
+        """Return ConferenceForms holding only the SUMMARY_FIELDS of conferences.
+
+        Summaries are read through memcache; the misses are built from one
+        get_multi of the conferences.
+        """
+        cacheKeys = dict((MEMCACHE_CONFERENCE_SUMMARY_KEY % wsck, wsck) for wsck in wscks)
+
+        def fromDatastore(missing):
+            conferences = [conf for conf in ndb.get_multi(
+                [ndb.Key(urlsafe=cacheKeys[cacheKey]) for cacheKey in missing]) if conf]
+            forms = self._copyConferencesToForms(conferences).items
+            return dict((MEMCACHE_CONFERENCE_SUMMARY_KEY % conf.key.urlsafe(),
+                         self._cacheableForm(conf, ConferenceForm(
+                             **dict((field, getattr(form, field)) for field in SUMMARY_FIELDS))))
+                        for conf, form in zip(conferences, forms))
+
+        summaries = readThroughMulti(cacheKeys.keys(), fromDatastore,
+            'conferenceSummary', ttl=CONFERENCE_CACHE_TIME)
+        forms = self._decodeConferences(dict((cacheKeys[cacheKey], summary)
+                                             for cacheKey, summary in summaries.items()))
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, getattr(prof, 'displayName')) for conf in confs]
+            items=[forms[wsck] for wsck in wscks if wsck in forms],
+            nextPageToken=nextPageToken
         )
 
 
@@ -313,8 +520,6 @@ class ConferenceApi(remote.Service):
             q = q.order(Conference.name)
 
         for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
             formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
             q = q.filter(formatted_query)
         return q
@@ -344,74 +549,110 @@ class ConferenceApi(remote.Service):
                 else:
                     inequality_field = filtr["field"]
 
+            if filtr["field"] in ["month", "maxAttendees"]:
+                filtr["value"] = int(filtr["value"])
             formatted_filters.append(filtr)
         return (inequality_field, formatted_filters)
 
 
+    def _fetchPage(self, query, request, keys_only=False):
+        """Fetch one bounded page of query results, returning (entities, nextPageToken).
+
+        Without pageSize/pageToken in the request the whole result set is
+        fetched in a single pass and no token is returned.
+        """
+        if not (request.pageSize or request.pageToken):
+            return query.fetch(keys_only=keys_only), None
+
+        page_size = request.pageSize or MAX_PAGE_SIZE
+        if page_size < 0:
+            raise endpoints.BadRequestException("'pageSize' must be a positive number.")
+        page_size = min(page_size, MAX_PAGE_SIZE)
+
+        cursor = None
+        if request.pageToken:
+            try:
+                cursor = Cursor(urlsafe=request.pageToken)
+            except (datastore_errors.BadValueError, TypeError):
+                raise endpoints.BadRequestException("Invalid 'pageToken'.")
+
+        try:
+            entities, next_cursor, more = query.fetch_page(page_size, start_cursor=cursor,
+                keys_only=keys_only)
+        except datastore_errors.BadRequestError:
+            # cursor does not belong to this query (e.g. filters changed)
+            raise endpoints.BadRequestException("Invalid 'pageToken'.")
+
+        next_token = next_cursor.urlsafe() if more and next_cursor else None
+        return entities, next_token
+
+
     @endpoints.method(ConferenceQueryForms, ConferenceForms,
             path='queryConferences',
             http_method='POST',
             name='queryConferences')
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
+        """Query for conferences (optionally paginated with pageSize/pageToken,
+        view=SUMMARY for list fields only)."""
+        # cached results are keyed by the canonical form of the filters
+        filters = sorted((f["field"], f["operator"], f["value"])
+                         for f in self._formatFilters(request.filters)[1])
+        cache_key = conferenceQueryKey(filters, request.pageSize, request.pageToken)
+        generation, cached = getConferenceQuery(cache_key)
+        summary = request.view == ConferenceView.SUMMARY
+        if cached is not None:
+            wscks, next_token = cached
+            if summary:
+                return self._summariesToForms(wscks, next_token)
+            return self._cachedConferencesToForms(wscks, next_token)
+
+        if summary:
+            # keys-only query; the list fields come from the summary cache
+            keys, next_token = self._fetchPage(self._getQuery(request), request, keys_only=True)
+            wscks = [key.urlsafe() for key in keys]
+            setConferenceQuery(cache_key, generation, (wscks, next_token))
+            return self._summariesToForms(wscks, next_token)
+
+        conferences, next_token = self._fetchPage(self._getQuery(request), request)
+        setConferenceQuery(cache_key, generation,
+            ([conf.key.urlsafe() for conf in conferences], next_token))
 
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId)) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
+        # return individual ConferenceForm object per Conference
+        return self._copyConferencesToForms(conferences, next_token)
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
 
-        # return individual ConferenceForm object per Conference
-        return ConferenceForms(
-                items=[self._copyConferenceToForm(conf, names[conf.organizerUserId]) for conf in \
-                conferences]
-        )
+    def _cachedConferencesToForms(self, wscks, nextPageToken=None):
+        """Return ConferenceForms for a cached list of conference keys.
+
+        Forms cached by getConference() are used as they are; only the
+        remaining conferences are fetched (with one get_multi).
+        """
+        cached = memcache.get_multi([MEMCACHE_CONFERENCE_KEY % wsck for wsck in wscks])
+        missing = [ndb.Key(urlsafe=wsck) for wsck in wscks
+                   if MEMCACHE_CONFERENCE_KEY % wsck not in cached]
+        conferences = [conf for conf in ndb.get_multi(missing) if conf]
+        fetched = dict(zip([conf.key.urlsafe() for conf in conferences],
+                           self._copyConferencesToForms(conferences).items))
+        fetched.update(self._decodeConferences(dict(
+            (wsck, cached[MEMCACHE_CONFERENCE_KEY % wsck]) for wsck in wscks
+            if MEMCACHE_CONFERENCE_KEY % wsck in cached)))
+
+        items = [fetched[wsck] for wsck in wscks if wsck in fetched]
+        return ConferenceForms(items=items, nextPageToken=nextPageToken)
 
 
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
-        return pf
+        return PROFILE_FORM.toForm(prof)
 
 
     def _getProfileFromUser(self):
         """Return user Profile from datastore, creating new one if non-existent."""
-        # make sure user is authed
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-
-        # get Profile from datastore
-        user_id = getUserId(user)
-        p_key = ndb.Key(Profile, user_id)
-        profile = p_key.get()
-        # create new Profile if not there
-        if not profile:
-            profile = Profile(
-                key = p_key,
-                displayName = user.nickname(),
-                mainEmail= user.email(),
-                teeShirtSize = str(TeeShirtSize.NOT_SPECIFIED),
-            )
-            profile.put()
-
-        return profile      # return Profile
+        # make sure user is authed; the Profile is read once per request
+        # (and created with get_or_insert if not there)
+        return self._context().getProfile()      # return Profile
 
 
     def _doProfile(self, save_request=None):
@@ -421,6 +662,7 @@ class ConferenceApi(remote.Service):
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
+            oldDisplayName = prof.displayName
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
@@ -431,6 +673,11 @@ class ConferenceApi(remote.Service):
                         #else:
                         #    setattr(prof, field, val)
                         prof.put()
+            # copy the new name onto the user's conferences in the background
+            if prof.displayName != oldDisplayName:
+                taskqueue.add(params={'userId': prof.key.id()},
+                    url='/tasks/update_organizer_name'
+                )
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
@@ -450,89 +697,205 @@ class ConferenceApi(remote.Service):
         return self._doProfile(request)
 
 
-# - - - Announcements - - - - - - - - - - - - - - - - - - - -
+    @staticmethod
+    def _updateOrganizerDisplayName(userId):
+        """Copy Profile displayName onto every Conference the user organizes;
+        used by the update_organizer_name task after saveProfile().
+        """
+        p_key = ndb.Key(Profile, userId)
+
+        # conferences are children of the organizer Profile
+        query = Conference.query(ancestor=p_key)
+        updated = 0
+        cursor = None
+        more = True
+        while more:
+            conf_keys, cursor, more = query.fetch_page(ORGANIZER_NAME_BATCH_SIZE,
+                start_cursor=cursor, keys_only=True)
+            stale = ConferenceApi._updateOrganizerBatch(p_key, conf_keys)
+            if stale:
+                invalidate(*[cacheKey % key.urlsafe() for key in stale
+                             for cacheKey in (MEMCACHE_CONFERENCE_KEY, MEMCACHE_CONFERENCE_SUMMARY_KEY)])
+            updated += len(stale)
+        return updated
 
     @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
+    @ndb.transactional()
+    def _updateOrganizerBatch(p_key, conf_keys):
+        """Copy the organizer's displayName onto the conferences of
+        conf_keys, returning the keys of those changed.
+
+        The Profile and its conferences are one entity group, so they are
+        read again and written in one transaction: concurrent updates of
+        the conferences (e.g. registrations) are not overwritten.
         """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
+        entities = ndb.get_multi([p_key] + conf_keys)
+        prof, confs = entities[0], entities[1:]
+        if not prof:
+            return []
+        stale = [conf for conf in confs
+                 if conf and conf.organizerDisplayName != prof.displayName]
+        for conf in stale:
+            conf.organizerDisplayName = prof.displayName
+        ndb.put_multi(stale)
+        return [conf.key for conf in stale]
 
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = ANNOUNCEMENT_TPL % (
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
 
-        return announcement
+    @staticmethod
+    def _processBatch(query, batchSize, cursor, process, url, keys_only=False):
+        """Run process() on the next batchSize results of query after cursor
+        (websafe, None to start), chaining a task to url with the following
+        cursor while results remain. Returns what process() returns.
+        """
+        results, cursor, more = query.fetch_page(batchSize,
+            start_cursor=cursor and Cursor(urlsafe=cursor), keys_only=keys_only)
+        processed = process(results)
+        if more and cursor:
+            taskqueue.add(params={'cursor': cursor.urlsafe()}, url=url)
+        return processed
+
+    @staticmethod
+    def _reindexProfiles(cursor=None):
+        """Rewrite a batch of Profiles so their computed properties are
+        indexed, their legacy urlsafe keys are migrated (see
+        Profile.migrateKeys()) and their registrations are in the attendee
+        index, chaining the reindex_profiles task until all are done.
+
+        Each Profile is read again and written in its own transaction, so
+        registrations and wishlist changes made meanwhile are kept.
+        """
+        def reindex(p_keys):
+            profiles = [ndb.transaction(lambda: ConferenceApi._reindexProfile(p_key))
+                        for p_key in p_keys]
+            profiles = [prof for prof in profiles if prof]
+            backfillAttendees(profiles)
+            return len(profiles)
+        return ConferenceApi._processBatch(Profile.query(), PROFILE_REINDEX_BATCH_SIZE,
+            cursor, reindex, '/tasks/reindex_profiles', keys_only=True)
+
+    @staticmethod
+    def _reindexProfile(p_key):
+        """Rewrite one Profile (if it still exists), migrating its keys."""
+        prof = p_key.get()
+        if prof:
+            prof.migrateKeys()
+            prof.put()
+        return prof
+
+
+    @staticmethod
+    def _reindexSessions(cursor=None):
+        """Rewrite a batch of Sessions so their computed properties are
+        indexed and they are in the speaker index, chaining the
+        reindex_sessions task until all are done.
+        """
+        def reindex(sessions):
+            ndb.put_multi(sessions + ConferenceApi._speakerSessions(sessions))
+            return len(sessions)
+        return ConferenceApi._processBatch(ConfSession.query(),
+            SESSION_REINDEX_BATCH_SIZE, cursor, reindex, '/tasks/reindex_sessions')
+
+
+    @staticmethod
+    def _deleteExpiredWishlistUpdates(cursor=None):
+        """Delete a batch of the WishlistUpdates (updateWishlist requestIds)
+        older than WISHLIST_UPDATE_LIFETIME, chaining the
+        delete_wishlist_updates task until all are gone.
+        """
+        expired = WishlistUpdate.query(
+            WishlistUpdate.created < datetime.now() - WISHLIST_UPDATE_LIFETIME)
+        def delete(keys):
+            ndb.delete_multi(keys)
+            return len(keys)
+        return ConferenceApi._processBatch(expired, WISHLIST_UPDATE_CLEANUP_BATCH_SIZE,
+            cursor, delete, '/tasks/delete_wishlist_updates', keys_only=True)
+
+
+# - - - Announcements - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _cacheAnnouncement():
+        """Reconcile the nearly sold out conferences & their Announcement;
+        used by the set_announcement cron job. Seat changes keep them up to
+        date in between (see announcements.py).
+        """
+        return reconcileAlmostSoldOut()
 
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
             path='conference/announcement/get',
             http_method='GET', name='getAnnouncement')
     def getAnnouncement(self, request):
-        """Return Announcement from memcache."""
-        return StringMessage(data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
+        """Return Announcement from memcache (or its stored copy)."""
+        return StringMessage(data=getAnnouncement())
 
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
         """Register or unregister user for selected conference."""
-        retval = None
-        prof = self._getProfileFromUser() # get user Profile
-
         # check if conf exists given websafeConfKey
-        # get conference; check that it exists
+        # get conference; check that it exists (outside of the transaction,
+        # so registrations do not contend on the Conference entity group)
         wsck = request.websafeConferenceKey
         conf = ndb.Key(urlsafe=wsck).get()
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
+        return self._registerProfile(conf, reg)
+
+
+    @ndb.transactional(xg=True)
+    def _registerProfile(self, conf, reg):
+        """Register or unregister the user for conf in one transaction.
+
+        The seats of sharded conferences are taken from their shards, so
+        only conferences without shards (seats kept on the entity) are
+        read again and join the transaction.
+        """
+        retval = None
+        if not conf.seatShards:
+            conf = conf.key.get()
+        wsck = conf.key.urlsafe()
+        prof = self._getProfileFromUser() # get user Profile
+        attending = set(prof.conferenceKeysToAttend)
 
         # register
         if reg:
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if conf.key in attending:
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
+            # check if seats avail and take away one seat
+            if not reserveSeat(conf):
                 raise ConflictException(
                     "There are no seats available.")
 
-            # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
+            # register user
+            prof.conferenceKeysToAttend.append(conf.key)
+            addAttendee(wsck, prof.key.id())
             retval = True
 
         # unregister
         else:
             # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            if conf.key in attending:
 
                 # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
+                prof.conferenceKeysToAttend.remove(conf.key)
+                removeAttendee(wsck, prof.key.id())
+                releaseSeat(conf)
                 retval = True
             else:
                 retval = False
 
         # write things back to the datastore & return
+        # (seats are written by reserveSeat/releaseSeat; cached forms only
+        # hold the seats of conferences without shards)
         prof.put()
-        conf.put()
+        if retval and not conf.seatShards:
+            ndb.get_context().call_on_commit(lambda: invalidateConference(wsck))
         return BooleanMessage(data=retval)
 
 
@@ -542,22 +905,11 @@ class ConferenceApi(remote.Service):
     def getConferencesToAttend(self, request):
         """Get list of conferences that user has registered for."""
         prof = self._getProfileFromUser() # get user Profile
-        conf_keys = [ndb.Key(urlsafe=wsck) for wsck in prof.conferenceKeysToAttend]
-        conferences = ndb.get_multi(conf_keys)
-
-        # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        conferences = ndb.get_multi(prof.conferenceKeysToAttend)
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copyConferenceToForm(conf, names[conf.organizerUserId])\
-         for conf in conferences]
-        )
+        # (deleted conferences are skipped)
+        return self._copyConferencesToForms(conferences)
 
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
@@ -576,6 +928,45 @@ class ConferenceApi(remote.Service):
         return self._conferenceRegistration(request, reg=False)
 
 
+    def _copyTicketToForm(self, ticket):
+        """Copy relevant fields from RegistrationTicket to RegistrationTicketForm."""
+        return RegistrationTicketForm(
+            ticket=ticket.key.urlsafe(),
+            websafeConferenceKey=ticket.websafeConferenceKey,
+            status=getattr(RegistrationStatus, ticket.status),
+            message=ticket.message,
+        )
+
+
+    @endpoints.method(CONF_GET_REQUEST, RegistrationTicketForm,
+            path='conference/{websafeConferenceKey}/queue',
+            http_method='POST', name='queueRegistrationForConference')
+    def queueRegistrationForConference(self, request):
+        """Queue registration for selected conference, returning a ticket to poll."""
+        prof = self._getProfileFromUser() # get user Profile
+
+        wsck = request.websafeConferenceKey
+        if not ndb.Key(urlsafe=wsck).get():
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+
+        return self._copyTicketToForm(queueRegistration(prof, wsck))
+
+
+    @endpoints.method(TICKET_GET_REQUEST, RegistrationTicketForm,
+            path='registration_ticket/{ticket}',
+            http_method='GET', name='getRegistrationTicket')
+    def getRegistrationTicket(self, request):
+        """Return the status of a queued registration."""
+        prof = self._getProfileFromUser() # get user Profile
+
+        ticket = ndb.Key(urlsafe=request.ticket).get()
+        if not ticket or ticket.userId != prof.key.id():
+            raise endpoints.NotFoundException(
+                'No registration ticket found with key: %s' % request.ticket)
+        return self._copyTicketToForm(ticket)
+
+
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             path='filterPlayground',
             http_method='GET', name='filterPlayground')
@@ -592,7 +983,7 @@ class ConferenceApi(remote.Service):
         q = q.filter(Conference.month==6)
 
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "") for conf in q]
+            items=CONFERENCE_FORM.toForms(q)
         )
 
     ############################################
@@ -600,44 +991,33 @@ class ConferenceApi(remote.Service):
     #####  TASK 1 : Add Sessions to a Conference
     ############################################
     ############################################
-    def _getSpeakerFromName(self, speakerDisplayName):
-        """Return speaker from datastore, creating new one if non-existent."""
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-
-        # get Speaker from datastore
-        user_id = speakerDisplayName
-        p_key = ndb.Key(ConfSpeaker, user_id)
-        speaker = p_key.get()
-        # create new Speaker if not there
-        if not speaker:
-            speaker = ConfSpeaker(
-                key = p_key,
-                displayName = speakerDisplayName
-            )
-            speaker.put()
-
-        return speaker      # return Speaker
-
     def _copySessionToForm(self, sess, speakerDisplayName):
         """Copy relevant fields from Session to SessionForm."""
-        cs = ConfSessionForm()
-        for field in cs.all_fields():
-            if hasattr(sess, field.name):
-                # convert Date to date string; just copy others
-                if field.name == 'duration' or field.name == 'date' or field.name == 'start_time':
-                    setattr(cs, field.name, str(getattr(sess, field.name)))
-                elif field.name == 'typeOfSession':
-                    setattr(cs, field.name, getattr(ConfSessionType, getattr(sess, field.name)))
-                else:
-                    setattr(cs, field.name, getattr(sess, field.name))
-            elif field.name == "websafeKey":
-                setattr(cs, field.name, sess.key.urlsafe())
-        if speakerDisplayName:
-            setattr(cs, 'speakerDisplayName', speakerDisplayName)
-        cs.check_initialized()
-        return cs
+        return SESSION_FORM.toForm(sess, speakerDisplayName)
+
+    def _copySessionsToForms(self, sessions):
+        """Return ConfSessionForms for sessions, materializing them only once.
+
+        sessions can be an ndb.Query, a future (e.g. from fetch_async) or a
+        list of entities; missing (None) entities are skipped. Speaker names
+        come from the denormalized speakerDisplayName, falling back to the
+        speaker directory for older sessions.
+        """
+        if isinstance(sessions, ndb.Query):
+            sessions = sessions.fetch_async()
+        if isinstance(sessions, ndb.Future):
+            sessions = sessions.get_result()
+        sessions = [sess for sess in sessions if sess]
+
+        # get display names (once per distinct speaker) for sessions
+        # created before speakerDisplayName was stored on the session
+        names = resolveSpeakers([sess.speakerId for sess in sessions
+                                 if sess.speakerDisplayName is None and sess.speakerId],
+                                create=False)
+
+        return ConfSessionForms(
+            items=SESSION_FORM.toForms(sessions, names)
+        )
 
     @endpoints.method(SESS_POST_REQUEST, ConfSessionForm, path='session/{websafeConferenceKey}',
             http_method='POST', name='createSession')
@@ -645,35 +1025,42 @@ class ConferenceApi(remote.Service):
         """Create new session."""
         return self._createSessionObject(request)
 
-    def _createSessionObject(self, request):
-        """Create Session object, returning SessionForm/request."""
-        # preload necessary data items
+    @endpoints.method(SESSIONS_POST_REQUEST, ConfSessionForms, path='sessions/{websafeConferenceKey}',
+            http_method='POST', name='createSessions')
+    def createSessions(self, request):
+        """Create several sessions at once."""
+        return self._createSessionObjects(request)
 
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
+    def _getOrganizedConference(self, websafeConferenceKey, conf_future=None):
+        """Return the conference (from conf_future if it is already being
+        fetched), checking that the current user organizes it."""
+        user_id = self._context().userId
 
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf = (conf_future or ndb.Key(urlsafe=websafeConferenceKey).get_async()).get_result()
         if not conf:
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
-
-        user_id = getUserId(user)
+                'No conference found with key: %s' % websafeConferenceKey)
 
         if conf.organizerUserId != user_id:
             raise endpoints.UnauthorizedException('You can only create sessions for your conferences')
+        return conf
 
-        if not request.name:
+    def _sessionDataFromForm(self, form):
+        """Check a SessionForm & return its fields converted for ConfSession."""
+        if not form.name:
             raise endpoints.BadRequestException("Session 'name' field required")
 
+        if not form.speakerDisplayName:
+            raise endpoints.BadRequestException("Session 'speakerDisplayName' field required")
+
         # copy SessionForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
+        data = {field.name: getattr(form, field.name) for field in form.all_fields()}
 
         # add default values for those missing (both data model & outbound Message)
         for df in SESS_DEFAULTS:
             if data[df] in (None, []):
                 data[df] = SESS_DEFAULTS[df]
-                setattr(request, df, SESS_DEFAULTS[df])
+                setattr(form, df, SESS_DEFAULTS[df])
 
         # convert dates from strings to Date/Time objects
         if data['duration']:
@@ -685,129 +1072,201 @@ class ConferenceApi(remote.Service):
         if data['date']:
             data['date'] = datetime.strptime(data['date'][:10], "%Y-%m-%d").date()
 
-        speaker = self._getSpeakerFromName(data['speakerDisplayName'])
-
-        # generate Session Key based on conference ID
-        p_key = conf.key
-        c_id = ConfSession.allocate_ids(size=1, parent=p_key)[0]
-        c_key = ndb.Key(ConfSession, c_id, parent=p_key)
-        data['key'] = c_key
-        data['speakerId'] = request.speakerId = speaker.key.id()
-
         if not data['typeOfSession']:
             data['typeOfSession'] = str(ConfSessionType.NOT_SPECIFIED)
 
         data['typeOfSession'] = str(data['typeOfSession'])
         del data['websafeKey']
-        del data['speakerDisplayName']
-        del data['websafeConferenceKey']
+        data.pop('websafeConferenceKey', None)
+        return data
 
-        # create Session
-        ConfSession(**data).put()
+    def _createSessionObject(self, request):
+        """Create Session object, returning SessionForm/request."""
+        data = self._sessionDataFromForm(request)
 
-        # append to speaker sessions
-        speaker.confSessionKeysToAttend.append(c_key)
+        # preload necessary data items: the conference and the Session ID
+        # (based on the conference key) are fetched in parallel; the
+        # speaker comes from the speaker directory (created if missing)
+        p_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        conf_future = p_key.get_async()
+        ids_future = ConfSession.allocate_ids_async(size=1, parent=p_key)
 
-        # sessions of this speaker and this conference (using filter .ancestor)
-        sessionsInThisConf = ConfSession.query(ancestor=conf.key)
-        sessionsInThisConf = sessionsInThisConf.filter(ConfSession.speakerId==speaker.key.id())
+        conf = self._getOrganizedConference(request.websafeConferenceKey, conf_future)
+        speakerName = data['speakerDisplayName']
+        speakers = resolveSpeakers([speakerName])
 
-        if sessionsInThisConf.count(2)>1:
-            taskqueue.add(params={'speakerKey': speaker.key.urlsafe(),
-                'conferenceKey': request.websafeConferenceKey},
-                url='/tasks/set_featured_speaker'
-            )
+        # generate Session Key based on conference ID
+        c_id = ids_future.get_result()[0]
+        c_key = ndb.Key(ConfSession, c_id, parent=p_key)
+        data['key'] = c_key
+        data['speakerId'] = request.speakerId = speakerName
+        data['speakerDisplayName'] = speakers[speakerName]
+
+        # create Session (and count it for the featured speaker)
+        sess = ConfSession(**data)
+        self._storeSessions(conf, [sess])
+
+        return self._copySessionToForm(sess, data['speakerDisplayName'])
+
+    def _createSessionObjects(self, request):
+        """Create Session objects in bulk, returning SessionForms."""
+        conf = self._getOrganizedConference(request.websafeConferenceKey)
+
+        if len(request.items) > MAX_SESSIONS_PER_IMPORT:
+            raise endpoints.BadRequestException(
+                'At most %d sessions can be created at once.' % MAX_SESSIONS_PER_IMPORT)
+        if not request.items:
+            return ConfSessionForms()
+
+        datas = [self._sessionDataFromForm(form) for form in request.items]
+        speakers = resolveSpeakers([data['speakerDisplayName'] for data in datas])
+
+        # generate all Session Keys with one allocation
+        first, last = ConfSession.allocate_ids(size=len(datas), parent=conf.key)
+        sessions = []
+        for c_id, data in zip(range(first, last + 1), datas):
+            data['key'] = ndb.Key(ConfSession, c_id, parent=conf.key)
+            # speakers are keyed by their display name
+            data['speakerId'] = data['speakerDisplayName']
+            data['speakerDisplayName'] = speakers[data['speakerId']]
+            sessions.append(ConfSession(**data))
+
+        # write in transactions small enough for the datastore limits,
+        # then enqueue one featured speaker task per speaker
+        batches = [[]]
+        batchSpeakers = set()
+        for sess in sessions:
+            if len(batches[-1]) == SESSION_BATCH_SIZE or (sess.speakerId not in batchSpeakers
+                    and len(batchSpeakers) == MAX_SPEAKERS_PER_BATCH):
+                batches.append([])
+                batchSpeakers = set()
+            batches[-1].append(sess)
+            batchSpeakers.add(sess.speakerId)
+        counters = {}
+        for batch in batches:
+            for counter in self._storeSessions(conf, batch, enqueue=False):
+                counters[counter.key.id()] = counter
+        self._enqueueFeatured(conf, counters.values())
 
-        return self._copySessionToForm(c_key.get(), speaker.displayName)
+        return ConfSessionForms(
+            items=SESSION_FORM.toForms(sessions)
+        )
+
+    @staticmethod
+    def _speakerSessions(sessions):
+        """Return the speaker index entries (SpeakerSession) of sessions."""
+        return [SpeakerSession(id=sess.key.urlsafe(),
+                               parent=ndb.Key(ConfSpeaker, sess.speakerId))
+                for sess in sessions if sess.speakerId]
+
+    @ndb.transactional(xg=True)
+    def _storeSessions(self, conf, sessions, enqueue=True):
+        """Write sessions of conf with their per-speaker counters and speaker
+        index entries in one transaction (at most MAX_SPEAKERS_PER_BATCH
+        speakers), returning the counters. Unless enqueue is False, the
+        featured speaker task is enqueued after commit for speakers that
+        have at least FEATURED_SPEAKER_MIN_SESSIONS sessions in conf.
+        """
+        bySpeaker = {}
+        for sess in sessions:
+            bySpeaker.setdefault(sess.speakerId, []).append(sess)
+
+        keys = [ndb.Key(ConfSpeakerCounter, speakerId, parent=conf.key) for speakerId in bySpeaker]
+        counters = []
+        for key, counter in zip(keys, ndb.get_multi(keys)):
+            if not counter:
+                # first session counted for this speaker: start from the
+                # sessions stored before counters existed
+                counter = ConfSpeakerCounter(key=key)
+                for sess in ConfSession.query(ConfSession.speakerId==key.id(), ancestor=conf.key):
+                    counter.sessionCount += 1
+                    counter.sessionNames.append(sess.name)
+            for sess in bySpeaker[key.id()]:
+                counter.sessionCount += 1
+                counter.sessionNames.append(sess.name)
+            counters.append(counter)
+
+        ndb.put_multi(sessions + counters + self._speakerSessions(sessions))
+
+        if enqueue:
+            ndb.get_context().call_on_commit(lambda: self._enqueueFeatured(conf, counters))
+        return counters
+
+    def _enqueueFeatured(self, conf, counters):
+        """Enqueue the featured speaker task of each featured counter; the
+        message is built from the task payload, no query needed.
+        """
+        # speakers are keyed by their display name
+        tasks = [taskqueue.Task(params={'speakerName': counter.key.id(),
+                    'sessionNames': counter.sessionNames,
+                    'conferenceName': conf.name,
+                    'conferenceKey': conf.key.urlsafe()},
+                    url='/tasks/set_featured_speaker'
+                 ) for counter in counters
+                 if counter.sessionCount >= FEATURED_SPEAKER_MIN_SESSIONS]
+        # one RPC per batch of tasks
+        queue = taskqueue.Queue()
+        for i in range(0, len(tasks), taskqueue.MAX_TASKS_PER_ADD):
+            queue.add(tasks[i:i + taskqueue.MAX_TASKS_PER_ADD])
 
     @endpoints.method(CONF_GET_REQUEST, ConfSessionForms, path='conference_sessions/{websafeConferenceKey}',
             http_method='GET', name='getConferenceSessions')
     def getConferenceSessions(self, request):
         """Given a conference, return all sessions."""
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
 
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        # create ancestor query for all key matches for this conference;
+        # it runs while the conference is being checked
+        sessions = ConfSession.query(ancestor=c_key).fetch_async()
+
+        conf = c_key.get()
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)
 
-        # create ancestor query for all key matches for this conference
-        sessions = ConfSession.query(ancestor=conf.key)
-
-        # get speakers
-        speakers = [ndb.Key(ConfSpeaker, sess.speakerId) for sess in sessions]
-        profiles = ndb.get_multi(speakers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
-
         # return set of SessionForm objects
-        return ConfSessionForms(
-            items=[self._copySessionToForm(sess, names[sess.speakerId]) for sess in sessions]
-        )
+        return self._copySessionsToForms(sessions)
 
     @endpoints.method(SESSBYTPE_GET_REQUEST, ConfSessionForms, path='conference_sessions_by_type/{websafeConferenceKey}/{typeOfSession}',
             http_method='GET', name='getConferenceSessionsByType')
     def getConferenceSessionsByType(self, request):
         """Given a conference, return all sessions of a specified type"""
-
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
-        if not conf:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
 
         # create ancestor query for all key matches for this conference
-        sessions = ConfSession.query(ancestor=conf.key)
+        sessions = ConfSession.query(ancestor=c_key)
 
-        # filter by type of session
+        # filter by type of session; it runs while the conference is being checked
         sessions = sessions.filter(ConfSession.typeOfSession==str(request.typeOfSession))
+        sessions = sessions.fetch_async()
 
-        # get speakers
-        speakers = [ndb.Key(ConfSpeaker, sess.speakerId) for sess in sessions]
-        profiles = ndb.get_multi(speakers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        conf = c_key.get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % request.websafeConferenceKey)
 
         # return set of SessionForm objects
-        return ConfSessionForms(
-            items=[self._copySessionToForm(sess, names[sess.speakerId]) for sess in sessions]
-        )
+        return self._copySessionsToForms(sessions)
 
     @endpoints.method(SESSBYSPEAKER_GET_REQUEST, ConfSessionForms, path='sessions_by_speaker/{speakerDisplayName}',
         http_method='GET', name='getSessionsBySpeaker')
     def getSessionsBySpeaker(self, request):
         """Given a speaker, return all sessions given by this particular speaker, across all conferences"""
 
-        # get speaker (to check if it exists
-        speaker = ndb.Key(ConfSpeaker, request.speakerDisplayName).get()
-
-        if not speaker:
+        # check that the speaker exists (in the speaker directory)
+        speakerName = request.speakerDisplayName
+        if speakerName not in resolveSpeakers([speakerName], create=False):
             raise endpoints.NotFoundException(
-                'No speaker found with speakerDisplayName: %s' % request.speakerDisplayName)
-
-        # create ancestor query for all key matches for this conference
-        sessions = ConfSession.query()
-
-        # filter by type of session
-        sessions = sessions.filter(ConfSession.speakerId==speaker.key.id())
+                'No speaker found with speakerDisplayName: %s' % speakerName)
 
-        # get speakers
-        speakers = [ndb.Key(ConfSpeaker, sess.speakerId) for sess in sessions]
-        profiles = ndb.get_multi(speakers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        # read the sessions listed in the speaker index (a keys-only
+        # ancestor query) with one get_multi
+        index = SpeakerSession.query(ancestor=ndb.Key(ConfSpeaker, speakerName))
+        sessions = ndb.get_multi([ndb.Key(urlsafe=key.id())
+                                  for key in index.fetch(keys_only=True)])
 
         # return set of SessionForm objects
-        return ConfSessionForms(
-            items=[self._copySessionToForm(sess, names[sess.speakerId]) for sess in sessions]
-        )
+        return self._copySessionsToForms(sessions)
 
     ############################################
     ############################################
@@ -815,6 +1274,55 @@ class ConferenceApi(remote.Service):
     ############################################
     ############################################
 
+    def _sessionKeysFromForm(self, websafeSessionKeys):
+        """Return the distinct Session keys of websafeSessionKeys, in order."""
+        keys = []
+        for wssk in websafeSessionKeys:
+            try:
+                key = ndb.Key(urlsafe=wssk)
+            except (TypeError, ProtocolBufferDecodeError):
+                key = None
+            if not key or key.kind() != ConfSession._get_kind():
+                raise endpoints.BadRequestException(
+                    'Invalid session key: %s' % wssk)
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    @ndb.transactional()
+    def _updateWishlist(self, p_key, add, remove, requestId=None):
+        """Add and remove Session keys to/from the wishlist of a Profile in
+        one transaction, returning (added, removed, profile).
+
+        Requests carrying a requestId are applied once: a retry within
+        WISHLIST_UPDATE_LIFETIME returns the counts recorded by the first
+        attempt.
+        """
+        token = None
+        if requestId:
+            token = ndb.Key(WishlistUpdate, requestId, parent=p_key).get()
+        prof = p_key.get()
+        # expired tokens may not be deleted yet (delete_wishlist_updates)
+        if token and token.created > datetime.now() - WISHLIST_UPDATE_LIFETIME:
+            return token.added, token.removed, prof
+
+        prof.migrateKeys()
+        wishlist = set(prof.sessionWishlist)
+        added = [key for key in add if key not in wishlist]
+        dropped = wishlist.intersection(remove)
+        prof.sessionWishlist = [key for key in prof.sessionWishlist
+                                if key not in dropped] + added
+
+        # write things back to the datastore (only if anything changed)
+        changed = []
+        if added or dropped:
+            changed.append(prof)
+        if requestId:
+            changed.append(WishlistUpdate(id=requestId, parent=p_key,
+                added=len(added), removed=len(dropped)))
+        ndb.put_multi(changed)
+        return len(added), len(dropped), prof
+
     def _wishlistRegistration(self, request, reg=True):
         """Register or unregister user for selected conference."""
         retval = True
@@ -830,26 +1338,50 @@ class ConferenceApi(remote.Service):
 
         # register
         if reg:
-            # check if user already added this session otherwise add
-            if wsck in prof.sessionWishlist:
+            # add the session unless the user already added it
+            added, _, _ = self._updateWishlist(prof.key, [sess.key], [])
+            if not added:
                 raise ConflictException(
                     "You have already added this session to your wishlist")
 
-            # register user, take away one seat
-            prof.sessionWishlist.append(wsck)
-
         # unregister
         else:
-            # check if user already added this session
-            if wsck in prof.sessionWishlist:
-
-                # unregister session from the wishlist
-                prof.sessionWishlist.remove(wsck)
+            # unregister session from the wishlist (if it is there)
+            self._updateWishlist(prof.key, [], [sess.key])
 
-        # write things back to the datastore & return
-        prof.put()
         return BooleanMessage(data=retval)
 
+    @endpoints.method(WishlistUpdateForm, WishlistUpdateResultForm,
+            path='wishlist', http_method='POST', name='updateWishlist')
+    def updateWishlist(self, request):
+        """Add and remove several sessions to/from the user wishlist at once.
+
+        Sessions to add must exist; a request repeated with the same
+        requestId is applied only once.
+        """
+        prof = self._getProfileFromUser() # get user Profile
+
+        if len(request.add) + len(request.remove) > MAX_WISHLIST_UPDATE:
+            raise endpoints.BadRequestException(
+                'At most %d sessions can be updated at once' % MAX_WISHLIST_UPDATE)
+        add = self._sessionKeysFromForm(request.add)
+        remove = self._sessionKeysFromForm(request.remove)
+
+        # check that the sessions to add exist (with one get_multi);
+        # removed sessions may have been deleted since
+        missing = [key.urlsafe() for key, sess in zip(add, ndb.get_multi(add)) if not sess]
+        if missing:
+            raise endpoints.NotFoundException(
+                'No session found with key: %s' % ', '.join(missing))
+
+        added, removed, prof = self._updateWishlist(prof.key, add, remove,
+            request.requestId)
+        return WishlistUpdateResultForm(
+            added=added,
+            removed=removed,
+            websafeSessionKeys=[key.urlsafe() for key in prof.sessionWishlist]
+        )
+
     @endpoints.method(WSHL_GET_REQUEST, BooleanMessage,
             path='wishlist/{websafeSessionKey}',
             http_method='POST', name='addSessionToWishlist')
@@ -871,22 +1403,10 @@ class ConferenceApi(remote.Service):
     def getSessionsInWishlist(self, request):
         """Get list of conferences that user has registered for."""
         prof = self._getProfileFromUser() # get user Profile
-        conf_keys = [ndb.Key(urlsafe=wsck) for wsck in prof.sessionWishlist]
-        sessions = ndb.get_multi(conf_keys)
-
-        # get speakers
-        speakers = [ndb.Key(ConfSpeaker, sess.speakerId) for sess in sessions]
-        profiles = ndb.get_multi(speakers)
+        sessions = ndb.get_multi(prof.sessionWishlist)
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
-
-        # return set of SessionForm objects
-        return ConfSessionForms(
-            items=[self._copySessionToForm(sess, names[sess.speakerId]) for sess in sessions]
-        )
+        # return set of SessionForm objects (deleted sessions are skipped)
+        return self._copySessionsToForms(sessions)
 
     ############################################
     ############################################
@@ -894,18 +1414,8 @@ class ConferenceApi(remote.Service):
     ############################################
 
     def _copyProfileMiniToForm(self, prof):
-        """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileMiniForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
-        return pf
+        """Copy relevant fields from Profile to ProfileMiniForm."""
+        return PROFILE_MINI_FORM.toForm(prof)
 
     @endpoints.method(CONF_GET_REQUEST, ProfileListForm,
             path='additionalQuery1/{websafeConferenceKey}',
@@ -918,10 +1428,49 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)
 
-        profiles = Profile.query(Profile.conferenceKeysToAttend.IN([request.websafeConferenceKey]))
+        userIds = getAttendeeIds(request.websafeConferenceKey)
+        profiles = ndb.get_multi([ndb.Key(Profile, userId) for userId in userIds])
 
         return ProfileListForm(
-            items=[self._copyProfileMiniToForm(prof) for prof in profiles]
+            items=PROFILE_MINI_FORM.toForms(profiles),
+            count=len(userIds)
+        )
+
+    @endpoints.method(ATTENDEES_GET_REQUEST, ProfileListForm,
+            path='conference/{websafeConferenceKey}/attendees',
+            http_method='GET', name='getConferenceAttendees')
+    def getConferenceAttendees(self, request):
+        """Page through the users registered for a conference (pageSize/pageToken),
+        with the total count of attendees."""
+        if not ndb.Key(urlsafe=request.websafeConferenceKey).get():
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % request.websafeConferenceKey)
+
+        page_size = min(request.pageSize or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+        start, count = None, None
+        if request.pageToken:
+            try:
+                # the token is "<attendee shard>:<count>:<last user id>"
+                index, count, after = request.pageToken.split(':', 2)
+                start, count = (int(index), after), int(count)
+            except ValueError:
+                raise endpoints.BadRequestException("Invalid 'pageToken'.")
+        if page_size < 0 or (start and not 0 <= start[0] < NUM_ATTENDEE_SHARDS):
+            raise endpoints.BadRequestException("Invalid 'pageSize' or 'pageToken'.")
+
+        # only the attendee shards of the page are read; the count comes
+        # from the first page (through the token)
+        page, next_start, pageCount = getAttendeePage(
+            request.websafeConferenceKey, page_size, start)
+        if pageCount is not None:
+            count = pageCount
+        profiles = ndb.get_multi([ndb.Key(Profile, userId) for userId in page])
+
+        return ProfileListForm(
+            items=PROFILE_MINI_FORM.toForms(profiles),
+            nextPageToken='%d:%d:%s' % (next_start[0], count, next_start[1])
+                if next_start else None,
+            count=count
         )
 
     @endpoints.method(CONF_GET_REQUEST, ProfileListForm,
@@ -929,79 +1478,97 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='additionalQuery2')
     def additionalQuery2(self, request):
         """List of Users attended a conference, but didn't wishlisted a session of that conference"""
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
-
-        if not conf:
+        if not ndb.Key(urlsafe=request.websafeConferenceKey).get():
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)
 
-        profiles = Profile.query(Profile.conferenceKeysToAttend.IN([request.websafeConferenceKey]))
+        wsck = request.websafeConferenceKey
 
-        # get sessions for the conference
-        sessions = ConfSession.query(ancestor=conf.key)
+        # attendees (from the attendee index) minus the profiles that
+        # wishlisted any session of the conference (one keys-only index scan)
+        wishers = Profile.query(Profile.wishlistConferenceKeys==wsck).fetch_async(keys_only=True)
+        attendees = [ndb.Key(Profile, userId) for userId in getAttendeeIds(wsck)]
 
-        # add the session filters
-        for sess in sessions:
-            profiles = profiles.filter(Profile.sessionWishlist!=sess.key.urlsafe())
+        wishers = set(wishers.get_result())
+        profiles = ndb.get_multi([key for key in attendees if key not in wishers])
 
         return ProfileListForm(
-            items=[self._copyProfileMiniToForm(prof) for prof in profiles]
+            items=PROFILE_MINI_FORM.toForms(profiles)
         )
 
+    def _parseTime(self, value, name):
+        """Return the time of an 'HH:MM' string, or None if value is empty."""
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value[:5], "%H:%M").time()
+        except ValueError:
+            raise endpoints.BadRequestException("'%s' must be formatted as HH:MM." % name)
+
+    def _sessionSearchQuery(self, websafeConferenceKey=None, typeOfSession=None,
+                            excludeType=None, startAfter=None, startBefore=None):
+        """Return a Session query served by a single index scan.
+
+        Type exclusion is an equality filter on otherTypes, so it combines
+        with a start_time range (indexes are in index.yaml).
+        """
+        if typeOfSession and excludeType:
+            raise endpoints.BadRequestException(
+                "Use either 'typeOfSession' or 'excludeType'.")
+
+        ancestor = ndb.Key(urlsafe=websafeConferenceKey) if websafeConferenceKey else None
+        sessions = ConfSession.query(ancestor=ancestor)
+        if typeOfSession:
+            sessions = sessions.filter(ConfSession.typeOfSession == str(typeOfSession))
+        if excludeType:
+            sessions = sessions.filter(ConfSession.otherTypes == str(excludeType))
+        if startAfter:
+            sessions = sessions.filter(ConfSession.start_time >= startAfter)
+        if startBefore:
+            sessions = sessions.filter(ConfSession.start_time < startBefore)
+        return sessions.order(ConfSession.start_time)
+
+    @endpoints.method(ConfSessionSearchForm, ConfSessionForms,
+            path='searchSessions',
+            http_method='POST', name='searchSessions')
+    def searchSessions(self, request):
+        """Search sessions by type (or excluded type) and start time range,
+        optionally within one conference (paginated with pageSize/pageToken)."""
+        sessions = self._sessionSearchQuery(
+            websafeConferenceKey=request.websafeConferenceKey,
+            typeOfSession=request.typeOfSession,
+            excludeType=request.excludeType,
+            startAfter=self._parseTime(request.startAfter, 'startAfter'),
+            startBefore=self._parseTime(request.startBefore, 'startBefore'))
+
+        sessions, next_token = self._fetchPage(sessions, request)
+        forms = self._copySessionsToForms(sessions)
+        forms.nextPageToken = next_token
+        return forms
+
     @endpoints.method(message_types.VoidMessage, ConfSessionForms,
             path='problemQuery1',
             http_method='GET', name='getProblemQuerySolution1')
     def getProblemQuerySolution1(self, request):
-        """Return all non-workshop sessions before 7 pm. (using filter function of python)"""
-
-        sessions = ConfSession.query().filter(ConfSession.typeOfSession != str(ConfSessionType.WORKSHOP))
+        """Return all non-workshop sessions before 7 pm. (one index scan over otherTypes and start_time)"""
 
-        t = time(19, 0, 0)
-
-        sessions = list(filter((lambda sess: sess.start_time < t), sessions))
-
-        # get speakers
-        speakers = [ndb.Key(ConfSpeaker, sess.speakerId) for sess in sessions]
-        profiles = ndb.get_multi(speakers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        sessions = self._sessionSearchQuery(excludeType=ConfSessionType.WORKSHOP,
+            startBefore=time(19, 0, 0))
 
         # return set of SessionForm objects
-        return ConfSessionForms(
-            items=[self._copySessionToForm(sess, names[sess.speakerId]) for sess in sessions]
-        )
+        return self._copySessionsToForms(sessions)
 
     @endpoints.method(message_types.VoidMessage, ConfSessionForms,
             path='problemQuery2',
             http_method='GET', name='getProblemQuerySolution2')
     def getProblemQuerySolution2(self, request):
-        """Return all non-workshop sessions before 7 pm. (splitting the query with IN operator)"""
-
-        sessionTypes = [str(e) for e in ConfSessionType]
-        sessionTypes.remove(str(ConfSessionType.WORKSHOP))
-
-        sessions = ConfSession.query().filter(ConfSession.typeOfSession.IN(sessionTypes))
+        """Return all non-workshop sessions before 7 pm.
 
-        t = time(19, 0, 0)
-
-        sessions = sessions.filter(ConfSession.start_time < t)
-
-        # get speakers
-        speakers = [ndb.Key(ConfSpeaker, sess.speakerId) for sess in sessions]
-        profiles = ndb.get_multi(speakers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
-
-        # return set of SessionForm objects
-        return ConfSessionForms(
-            items=[self._copySessionToForm(sess, names[sess.speakerId]) for sess in sessions]
-        )
+        Deprecated alias of getProblemQuerySolution1, kept so that existing
+        clients of the problemQuery2 path keep working; the IN query it used
+        to run is superseded by the otherTypes index scan.
+        """
+        return self.getProblemQuerySolution1(request)
 
 
 
@@ -1012,25 +1579,21 @@ class ConferenceApi(remote.Service):
     ############################################
 
     @staticmethod
-    def _cacheFeatured(speakerKey, conferenceKey):
-        """Create Featured speaker & assign to memcache.
+    def _cacheFeatured(speakerName, sessionNames, conferenceName, conferenceKey=None):
+        """Create Featured speaker, store it for its conference & assign to memcache.
         """
 
-        conf = ndb.Key(urlsafe=conferenceKey).get()
-        speaker = ndb.Key(urlsafe=speakerKey).get()
-
-        updateCache = False
-
-        if conf and speaker:
-            sessions = ConfSession.query(ancestor=conf.key)
-            sessions = sessions.filter(ConfSession.speakerId==speaker.key.id())
-            updateCache = True
-
-        if updateCache and sessions:
+        if speakerName and sessionNames:
             # If there is a featured speaker
             # format announcement and set it in memcache
-            announcement = FEATURED_SPEAKER_TPL % (speaker.displayName,
-                ', '.join(sess.name for sess in sessions), conf.name)
+            announcement = FEATURED_SPEAKER_TPL % (speakerName,
+                ', '.join(sessionNames), conferenceName)
+            if conferenceKey:
+                if not ConferenceApi._storeFeatured(conferenceKey,
+                        speakerName, sessionNames, announcement):
+                    return announcement
+                memcache.set(MEMCACHE_FEATURED_KEY % conferenceKey, announcement,
+                    time=FEATURED_CACHE_TIME)
             memcache.set(MEMCACHE_FEATUREDMSG_KEY, announcement)
         else:
             # If there is no a featured speaker
@@ -1040,11 +1603,68 @@ class ConferenceApi(remote.Service):
 
         return announcement
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+    @staticmethod
+    @ndb.transactional()
+    def _storeFeatured(conferenceKey, speakerName, sessionNames, announcement):
+        """Store the featured speaker of a conference, returning False when a
+        newer announcement for the same speaker is already stored.
+        """
+        key = ndb.Key(FeaturedSpeaker, FEATURED_SPEAKER_ID, parent=ndb.Key(urlsafe=conferenceKey))
+        featured = key.get()
+        # tasks may run out of order; keep the longest list of sessions
+        if featured and featured.speakerName == speakerName and \
+                len(featured.sessionNames) > len(sessionNames):
+            return False
+        FeaturedSpeaker(key=key, speakerName=speakerName,
+            sessionNames=sessionNames, announcement=announcement).put()
+        return True
+
+    @staticmethod
+    def _getFeatured(wscks):
+        """Return {websafeConferenceKey: announcement} for conferences, read
+        through memcache with one get_multi (and one datastore get_multi).
+        """
+        cacheKeys = dict((MEMCACHE_FEATURED_KEY % wsck, wsck) for wsck in wscks)
+
+        def fromDatastore(missing):
+            keys = [ndb.Key(FeaturedSpeaker, FEATURED_SPEAKER_ID,
+                parent=ndb.Key(urlsafe=cacheKeys[cacheKey])) for cacheKey in missing]
+            # conferences without a featured speaker are cached as ""
+            return dict((cacheKey, featured.announcement if featured else "")
+                        for cacheKey, featured in zip(missing, ndb.get_multi(keys)))
+
+        announcements = readThroughMulti(cacheKeys.keys(), fromDatastore,
+            'featuredSpeaker', ttl=FEATURED_CACHE_TIME)
+        return dict((wsck, announcements.get(cacheKey) or "")
+                    for cacheKey, wsck in cacheKeys.items())
+
+    @staticmethod
+    def _latestFeatured():
+        """Return the most recent featured speaker announcement stored."""
+        featured = FeaturedSpeaker.query().order(-FeaturedSpeaker.updated).get()
+        return featured.announcement if featured else ""
+
+    @endpoints.method(CONF_GET_REQUEST, StringMessage,
             path='conference/featured_speaker/get',
             http_method='GET', name='getFeaturedSpeaker')
     def getFeaturedSpeaker(self, request):
-        """Return Featured speaker from memcache."""
-        return StringMessage(data=memcache.get(MEMCACHE_FEATUREDMSG_KEY) or "")
+        """Return Featured speaker of a conference (websafeConferenceKey),
+        or the latest one of any conference."""
+        if request.websafeConferenceKey:
+            wsck = request.websafeConferenceKey
+            return StringMessage(data=self._getFeatured([wsck])[wsck])
+        return StringMessage(data=readThrough(MEMCACHE_FEATUREDMSG_KEY,
+            self._latestFeatured, 'featuredSpeaker'))
+
+    @endpoints.method(ConferenceKeysForm, FeaturedSpeakerForms,
+            path='conference/featured_speakers',
+            http_method='POST', name='getFeaturedSpeakers')
+    def getFeaturedSpeakers(self, request):
+        """Return Featured speakers of several conferences."""
+        announcements = self._getFeatured(request.websafeConferenceKeys)
+        return FeaturedSpeakerForms(
+            items=[FeaturedSpeakerForm(websafeConferenceKey=wsck, data=announcements[wsck])
+                   for wsck in request.websafeConferenceKeys]
+        )
 
-api = endpoints.api_server([ConferenceApi]) # register API
+api = instrument(endpoints.api_server([ConferenceApi])) # register API
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""context.py
+
+Request-scoped state of ConferenceApi.
+
+A RequestContext resolves the current user, its user id and its Profile
+lazily and at most once per request, so helpers can ask for them freely
+without repeating get_current_user(), getUserId() or Profile gets.
+
+"""
+
+import endpoints
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import TeeShirtSize
+
+from utils import getUserId
+
+
+class RequestContext(object):
+    """Current user, user id and Profile of one API request."""
+
+    def __init__(self):
+        self._user = None
+        self._userId = None
+        self._profile = None    # future of the Profile
+
+    @property
+    def user(self):
+        """The current user; raises UnauthorizedException if not authed."""
+        if self._user is None:
+            self._user = endpoints.get_current_user()
+            if not self._user:
+                raise endpoints.UnauthorizedException('Authorization required')
+        return self._user
+
+    @property
+    def userId(self):
+        """The id of the current user."""
+        if self._userId is None:
+            self._userId = getUserId(self.user)
+        return self._userId
+
+    @property
+    def profileKey(self):
+        """The key of the current user's Profile."""
+        return ndb.Key(Profile, self.userId)
+
+    @ndb.tasklet
+    def _loadProfileAsync(self):
+        """Get the Profile, creating it in the same transaction if missing."""
+        profile = yield Profile.get_or_insert_async(self.userId,
+            displayName=self.user.nickname(),
+            mainEmail=self.user.email(),
+            teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED),
+        )
+        profile.migrateKeys()
+        raise ndb.Return(profile)
+
+    def getProfileAsync(self):
+        """Return a future of the current user's Profile, creating it if
+        non-existent.
+
+        Inside a transaction the Profile is read again (and the copy of
+        the request dropped), so read-modify-writes stay transactional.
+        """
+        if ndb.in_transaction():
+            self._profile = None
+            return self._loadProfileAsync()
+        if self._profile is None:
+            self._profile = self._loadProfileAsync()
+        return self._profile
+
+    def getProfile(self):
+        """Return the current user's Profile, creating it if non-existent."""
+        return self.getProfileAsync().get_result()
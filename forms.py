@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""forms.py
+
+Compiled entity to ProtoRPC form converters.
+
+A FormConverter resolves the field mapping between a model and a form
+once, at import: which form fields are copied from which properties, and
+how Date/Time properties (to strings) and enum names (to Enum values) are
+converted. Converting an entity then only runs the precomputed getters,
+instead of walking all_fields() with hasattr/getattr reflection and field
+name checks for every entity.
+
+"""
+
+import operator
+
+from google.appengine.ext import ndb
+from protorpc import messages
+
+from models import Conference
+from models import ConferenceForm
+from models import ConfSession
+from models import ConfSessionForm
+from models import Profile
+from models import ProfileForm
+from models import ProfileMiniForm
+
+# properties copied into string fields with str()
+_STRING_PROPERTIES = (ndb.DateProperty, ndb.TimeProperty, ndb.DateTimeProperty)
+
+
+def _websafeKey(entity):
+    """Return the websafe key of an entity."""
+    return entity.key.urlsafe()
+
+
+def _enumConverter(enum_type):
+    """Return a function turning an enum name into its enum_type value."""
+    values = dict((name, enum_type(name)) for name in enum_type.names())
+    return values.__getitem__
+
+
+def _websafeKeys(keys):
+    """Return the websafe form of a list of keys."""
+    return [key.urlsafe() for key in keys]
+
+
+def _chain(get, convert):
+    """Return get followed by convert."""
+    return lambda entity: convert(get(entity))
+
+
+class FormConverter(object):
+    """Copy entities of model into form messages.
+
+    Form fields named like a property of model are copied from it (key
+    lists as websafe strings), and websafeKey is filled with the entity
+    key. If nameField is given, it is a (form field, entity attribute)
+    pair: the display name looked up by the entity attribute in the names
+    passed to toForms() overrides the form field.
+    """
+
+    def __init__(self, model, form, nameField=None):
+        self.form = form
+        self.getters = []
+        # _properties is keyed by datastore name; fields match attribute names
+        properties = dict((prop._code_name, prop) for prop in model._properties.values())
+        for field in form.all_fields():
+            prop = properties.get(field.name)
+            if prop is not None:
+                get = operator.attrgetter(field.name)
+                if isinstance(field, messages.EnumField):
+                    get = _chain(get, _enumConverter(field.type))
+                elif isinstance(prop, _STRING_PROPERTIES):
+                    get = _chain(get, str)
+                elif isinstance(prop, ndb.KeyProperty) and prop._repeated:
+                    get = _chain(get, _websafeKeys)
+                self.getters.append((field.name, get))
+            elif field.name == 'websafeKey':
+                self.getters.append((field.name, _websafeKey))
+        self.required = any(field.required for field in form.all_fields())
+        self.nameField, self.nameKey = nameField or (None, None)
+
+    def toForm(self, entity, displayName=None):
+        """Return the form of entity, with displayName (if any) as its name."""
+        data = {}
+        for name, get in self.getters:
+            value = get(entity)
+            if value is not None:
+                data[name] = value
+        if displayName:
+            data[self.nameField] = displayName
+        form = self.form(**data)
+        if self.required:
+            form.check_initialized()
+        return form
+
+    def toForms(self, entities, names=None):
+        """Return the forms of entities, skipping missing (None) ones.
+
+        names maps the nameKey attribute of entities to display names.
+        """
+        if not names:
+            return [self.toForm(entity) for entity in entities if entity]
+        getKey = operator.attrgetter(self.nameKey)
+        return [self.toForm(entity, names.get(getKey(entity)))
+                for entity in entities if entity]
+
+
+CONFERENCE_FORM = FormConverter(Conference, ConferenceForm,
+    nameField=('organizerDisplayName', 'organizerUserId'))
+SESSION_FORM = FormConverter(ConfSession, ConfSessionForm,
+    nameField=('speakerDisplayName', 'speakerId'))
+PROFILE_FORM = FormConverter(Profile, ProfileForm)
+PROFILE_MINI_FORM = FormConverter(Profile, ProfileMiniForm)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""instrumentation.py
+
+Per-request cost accounting.
+
+InstrumentationMiddleware wraps a WSGI application (the Endpoints API and
+the webapp2 handlers) and records, per request: wall time, the API RPCs
+made (counted by service.call through an apiproxy post-call hook),
+memcache get hits and misses, and the response size. Each request is
+logged as one structured line and aggregated per path in-process; see
+getRequestStats() and the /_stats handler.
+
+"""
+
+import collections
+import json
+import logging
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+
+HOOK_NAME = 'instrumentation'
+
+_local = threading.local()          # record of the current request
+_lock = threading.Lock()
+_requestStats = {}
+
+
+def _postCall(service, call, request, response, rpc=None, error=None):
+    """Count an API call on the record of the current request."""
+    record = getattr(_local, 'record', None)
+    if record is None:
+        return
+    record['rpcs'][service + '.' + call] += 1
+    if service == 'memcache' and call == 'Get' and error is None:
+        hits = response.item_size()
+        record['memcacheHits'] += hits
+        record['memcacheMisses'] += request.key_size() - hits
+
+
+def _addToStats(record):
+    """Aggregate the record of a finished request by its path."""
+    with _lock:
+        stats = _requestStats.setdefault(record['path'], {
+            'requests': 0, 'errors': 0, 'totalMs': 0.0, 'maxMs': 0.0,
+            'responseBytes': 0, 'memcacheHits': 0, 'memcacheMisses': 0,
+            'rpcs': collections.defaultdict(int)})
+        stats['requests'] += 1
+        stats['errors'] += int(record['status'] >= 500)
+        stats['totalMs'] += record['ms']
+        stats['maxMs'] = max(stats['maxMs'], record['ms'])
+        stats['responseBytes'] += record['responseBytes']
+        stats['memcacheHits'] += record['memcacheHits']
+        stats['memcacheMisses'] += record['memcacheMisses']
+        for name, count in record['rpcs'].items():
+            stats['rpcs'][name] += count
+
+
+def getRequestStats():
+    """Return the aggregated stats per path, with the mean wall time."""
+    with _lock:
+        result = {}
+        for path, stats in _requestStats.items():
+            result[path] = dict(stats, rpcs=dict(stats['rpcs']),
+                                meanMs=stats['totalMs'] / stats['requests'])
+        return result
+
+
+class InstrumentationMiddleware(object):
+    """WSGI middleware recording the cost of each request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        # Endpoints calls arrive as /_ah/spi/ConferenceApi.<method>
+        record = _local.record = {
+            'path': environ.get('PATH_INFO', ''), 'status': 0,
+            'responseBytes': 0, 'memcacheHits': 0, 'memcacheMisses': 0,
+            'rpcs': collections.defaultdict(int)}
+        start = time.time()
+
+        def recordingStartResponse(status, headers, exc_info=None):
+            record['status'] = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        try:
+            result = self.app(environ, recordingStartResponse)
+            try:
+                body = list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            record['responseBytes'] = sum(len(chunk) for chunk in body)
+            return body
+        except Exception:
+            record['status'] = 500
+            raise
+        finally:
+            _local.record = None
+            record['ms'] = (time.time() - start) * 1000
+            _addToStats(record)
+            logging.info('request_stats %s', json.dumps(record, sort_keys=True))
+
+
+def instrument(app):
+    """Return app wrapped in InstrumentationMiddleware, installing the
+    apiproxy hook once per instance."""
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(HOOK_NAME, _postCall)
+    return InstrumentationMiddleware(app)
@@ -12,10 +12,17 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import json
+
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
 from conference import ConferenceApi
+from seats import reconcileSeats
+from registrations import processRegistrations
+from cache import getStats
+from instrumentation import getRequestStats
+from instrumentation import instrument
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
@@ -40,11 +47,87 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
 class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
     def post(self):
         """Set Featured Speaker in Memcache."""
-        ConferenceApi._cacheFeatured(self.request.get('speakerKey'), self.request.get('conferenceKey'))
+        ConferenceApi._cacheFeatured(self.request.get('speakerName'),
+            self.request.get_all('sessionNames'), self.request.get('conferenceName'),
+            self.request.get('conferenceKey'))
         self.response.set_status(204)
 
-app = webapp2.WSGIApplication([
+class UpdateOrganizerNameHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy organizer displayName onto the user's Conferences."""
+        ConferenceApi._updateOrganizerDisplayName(self.request.get('userId'))
+        self.response.set_status(204)
+
+class ReconcileSeatsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy sharded seat count onto the Conference."""
+        reconcileSeats(self.request.get('conferenceKey'))
+        self.response.set_status(204)
+
+class ProcessRegistrationsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Apply queued registrations (cron)."""
+        processRegistrations()
+        self.response.set_status(204)
+
+    def post(self):
+        """Apply queued registrations (task)."""
+        processRegistrations()
+        self.response.set_status(204)
+
+class ReindexProfilesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start rewriting Profiles (admin)."""
+        ConferenceApi._reindexProfiles()
+        self.response.set_status(204)
+
+    def post(self):
+        """Rewrite Profiles so their computed properties get indexed."""
+        ConferenceApi._reindexProfiles(self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+class ReindexSessionsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start rewriting Sessions (admin)."""
+        ConferenceApi._reindexSessions()
+        self.response.set_status(204)
+
+    def post(self):
+        """Rewrite Sessions so their computed properties get indexed."""
+        ConferenceApi._reindexSessions(self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+class DeleteWishlistUpdatesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start deleting expired wishlist requestIds (cron)."""
+        ConferenceApi._deleteExpiredWishlistUpdates()
+        self.response.set_status(204)
+
+    def post(self):
+        """Delete expired wishlist requestIds (task)."""
+        ConferenceApi._deleteExpiredWishlistUpdates(self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+class StatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return the request and cache stats of this instance (admin)."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps({
+            'requests': getRequestStats(),
+            'caches': getStats(),
+        }, indent=2, sort_keys=True))
+
+app = instrument(webapp2.WSGIApplication([
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/process_registrations', ProcessRegistrationsHandler),
+    ('/crons/delete_wishlist_updates', DeleteWishlistUpdatesHandler),
     ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
-], debug=True)
+    ('/tasks/update_organizer_name', UpdateOrganizerNameHandler),
+    ('/tasks/reconcile_seats', ReconcileSeatsHandler),
+    ('/tasks/process_registrations', ProcessRegistrationsHandler),
+    ('/tasks/reindex_profiles', ReindexProfilesHandler),
+    ('/tasks/reindex_sessions', ReindexSessionsHandler),
+    ('/tasks/delete_wishlist_updates', DeleteWishlistUpdatesHandler),
+    ('/_stats', StatsHandler),
+], debug=True))
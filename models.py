@@ -26,8 +26,40 @@ class Profile(ndb.Model):
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
-    conferenceKeysToAttend = ndb.StringProperty(repeated=True)
-    sessionWishlist = ndb.StringProperty(repeated=True)
+    conferenceKeysToAttend = ndb.KeyProperty('conferenceKeys', kind='Conference', repeated=True)
+    sessionWishlist = ndb.KeyProperty('sessionWishlistKeys', kind='ConfSession', repeated=True)
+    # urlsafe keys stored by older versions; moved onto the key lists above
+    # by migrateKeys()
+    legacyConferenceKeysToAttend = ndb.StringProperty('conferenceKeysToAttend', repeated=True)
+    legacySessionWishlist = ndb.StringProperty('sessionWishlist', repeated=True)
+    # conferences of the wishlisted sessions (sessions are children of
+    # their Conference), so wishlists can be looked up per conference
+    wishlistConferenceKeys = ndb.ComputedProperty(
+        lambda self: sorted(set(sess_key.parent().urlsafe()
+                                for sess_key in self.sessionWishlist)),
+        repeated=True)
+
+    def migrateKeys(self):
+        """Move the legacy urlsafe keys onto the key lists, returning
+        whether there were any. Profiles are migrated whenever they are
+        written, and by the reindex_profiles task.
+        """
+        if not (self.legacyConferenceKeysToAttend or self.legacySessionWishlist):
+            return False
+        for legacy, keys in ((self.legacyConferenceKeysToAttend, self.conferenceKeysToAttend),
+                             (self.legacySessionWishlist, self.sessionWishlist)):
+            known = set(keys)
+            for websafeKey in legacy:
+                key = ndb.Key(urlsafe=websafeKey)
+                if key not in known:
+                    known.add(key)
+                    keys.append(key)
+        self.legacyConferenceKeysToAttend = []
+        self.legacySessionWishlist = []
+        return True
+
+    def _pre_put_hook(self):
+        self.migrateKeys()
 
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
@@ -61,6 +93,22 @@ class Conference(ndb.Model):
     endDate         = ndb.DateProperty()
     maxAttendees    = ndb.IntegerProperty()
     seatsAvailable  = ndb.IntegerProperty()
+    organizerDisplayName = ndb.StringProperty(indexed=False) # copy of Profile.displayName
+    seatShards      = ndb.IntegerProperty(default=0, indexed=False) # 0: seats kept on the entity
+
+class ConferenceSeatShard(ndb.Model):
+    """ConferenceSeatShard -- one shard of a Conference seat counter"""
+    seatsAvailable  = ndb.IntegerProperty(default=0, indexed=False)
+
+class ConferenceAttendeeShard(ndb.Model):
+    """ConferenceAttendeeShard -- one shard of the attendee index of a Conference"""
+    userIds         = ndb.StringProperty(repeated=True, indexed=False)
+
+class AlmostSoldOut(ndb.Model):
+    """AlmostSoldOut -- nearly sold out conferences and their announcement (singleton)"""
+    conferenceKeys  = ndb.KeyProperty(repeated=True, indexed=False)
+    conferenceNames = ndb.StringProperty(repeated=True, indexed=False)
+    announcement    = ndb.TextProperty()
 
 class ConferenceForm(messages.Message):
     """ConferenceForm -- Conference outbound form message"""
@@ -80,6 +128,7 @@ class ConferenceForm(messages.Message):
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
 
 class TeeShirtSize(messages.Enum):
     """TeeShirtSize -- t-shirt size enumeration value"""
@@ -99,6 +148,11 @@ class TeeShirtSize(messages.Enum):
     XXXL_M = 14
     XXXL_W = 15
 
+class ConferenceView(messages.Enum):
+    """ConferenceView -- fields returned by Conference listings"""
+    FULL = 1
+    SUMMARY = 2
+
 class ConferenceQueryForm(messages.Message):
     """ConferenceQueryForm -- Conference query inbound form message"""
     field = messages.StringField(1)
@@ -108,6 +162,9 @@ class ConferenceQueryForm(messages.Message):
 class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
+    view = messages.EnumField('ConferenceView', 4, default='FULL')
 
 
 ############################################
@@ -125,11 +182,35 @@ class ConfSession(ndb.Model):
     typeOfSession = ndb.StringProperty(default='NOT_SPECIFIED')
     date = ndb.DateProperty()
     start_time = ndb.TimeProperty()
+    speakerDisplayName = ndb.StringProperty(indexed=False) # copy of ConfSpeaker.displayName
+    # the session types this session is not, so "not of type X" is an
+    # equality filter that combines with a start_time range in one index
+    otherTypes = ndb.ComputedProperty(
+        lambda self: [str(t) for t in ConfSessionType if str(t) != self.typeOfSession],
+        repeated=True)
 
 class ConfSpeaker(ndb.Model):
     """Speaker -- speaker object"""
     displayName = ndb.StringProperty()
-    confSessionKeysToAttend = ndb.StringProperty(repeated=True)
+    confSessionKeysToAttend = ndb.StringProperty(repeated=True) # unused; see SpeakerSession
+
+class SpeakerSession(ndb.Model):
+    """SpeakerSession -- session of a speaker (child of ConfSpeaker, keyed by
+    the websafe session key); the key is all there is"""
+
+
+class ConfSpeakerCounter(ndb.Model):
+    """SpeakerCounter -- sessions of a speaker in a conference (child of Conference)"""
+    sessionCount = ndb.IntegerProperty(default=0, indexed=False)
+    sessionNames = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class FeaturedSpeaker(ndb.Model):
+    """FeaturedSpeaker -- featured speaker of a conference (child of Conference)"""
+    speakerName = ndb.StringProperty(indexed=False)
+    sessionNames = ndb.StringProperty(repeated=True, indexed=False)
+    announcement = ndb.StringProperty(indexed=False)
+    updated = ndb.DateTimeProperty(auto_now=True)
 
 
 class ConfSessionType(messages.Enum):
@@ -154,6 +235,17 @@ class ConfSessionForm(messages.Message):
 class ConfSessionForms(messages.Message):
     """ConfSessionForms -- multiple Session outbound form message"""
     items = messages.MessageField(ConfSessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+class ConfSessionSearchForm(messages.Message):
+    """ConfSessionSearchForm -- Session search inbound form message"""
+    websafeConferenceKey = messages.StringField(1)
+    typeOfSession = messages.EnumField('ConfSessionType', 2)
+    excludeType = messages.EnumField('ConfSessionType', 3)
+    startAfter = messages.StringField(4)
+    startBefore = messages.StringField(5)
+    pageSize = messages.IntegerField(6, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(7)
 
 class ConfSpeakerForm(messages.Message):
     """SpeakerForm -- Speaker outbound form message"""
@@ -163,3 +255,58 @@ class ConfSpeakerForm(messages.Message):
 class ProfileListForm(messages.Message):
     """ProfileListForm -- Profile list outbound form message"""
     items = messages.MessageField(ProfileMiniForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    count = messages.IntegerField(3, variant=messages.Variant.INT32)
+
+class RegistrationStatus(messages.Enum):
+    """RegistrationStatus -- status of a queued registration"""
+    PENDING = 1
+    REGISTERED = 2
+    REJECTED = 3
+
+class RegistrationTicket(ndb.Model):
+    """RegistrationTicket -- queued conference registration request"""
+    userId = ndb.StringProperty()
+    websafeConferenceKey = ndb.StringProperty()
+    status = ndb.StringProperty(default='PENDING')
+    message = ndb.StringProperty(indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+class RegistrationTicketForm(messages.Message):
+    """RegistrationTicketForm -- queued registration outbound form message"""
+    ticket = messages.StringField(1)
+    websafeConferenceKey = messages.StringField(2)
+    status = messages.EnumField('RegistrationStatus', 3)
+    message = messages.StringField(4)
+
+class WishlistUpdate(ndb.Model):
+    """WishlistUpdate -- applied updateWishlist request, child of the Profile
+    and keyed by its requestId"""
+    added = ndb.IntegerProperty(indexed=False)
+    removed = ndb.IntegerProperty(indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+class WishlistUpdateForm(messages.Message):
+    """WishlistUpdateForm -- batch wishlist update inbound form message"""
+    add = messages.StringField(1, repeated=True)
+    remove = messages.StringField(2, repeated=True)
+    requestId = messages.StringField(3)
+
+class WishlistUpdateResultForm(messages.Message):
+    """WishlistUpdateResultForm -- batch wishlist update outbound form message"""
+    added = messages.IntegerField(1, variant=messages.Variant.INT32)
+    removed = messages.IntegerField(2, variant=messages.Variant.INT32)
+    websafeSessionKeys = messages.StringField(3, repeated=True)
+
+class ConferenceKeysForm(messages.Message):
+    """ConferenceKeysForm -- multiple websafe Conference keys inbound form message"""
+    websafeConferenceKeys = messages.StringField(1, repeated=True)
+
+class FeaturedSpeakerForm(messages.Message):
+    """FeaturedSpeakerForm -- featured speaker of a Conference outbound form message"""
+    websafeConferenceKey = messages.StringField(1)
+    data = messages.StringField(2)
+
+class FeaturedSpeakerForms(messages.Message):
+    """FeaturedSpeakerForms -- multiple FeaturedSpeakerForm outbound form message"""
+    items = messages.MessageField(FeaturedSpeakerForm, 1, repeated=True)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""registrations.py
+
+Queued conference registration for registration bursts.
+
+queueRegistration() stores a RegistrationTicket and adds the request to the
+registration-requests pull queue, tagged with the conference key, so the
+endpoint answers right away. processRegistrations() leases the requests of
+one conference at a time and applies them in batches of
+REGISTRATION_BATCH_SIZE, each batch in a single xg transaction, then
+records the outcome on the tickets.
+
+"""
+
+import json
+import time
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import RegistrationStatus
+from models import RegistrationTicket
+
+from seats import reserveSeats
+from attendees import addAttendees
+
+from cache import invalidateConference
+
+REGISTRATION_QUEUE = 'registration-requests'
+# profiles per transaction; together with the seat shards and attendee
+# shards of the conference (or the Conference itself, if it has no seat
+# shards) this stays under the 25 entity group limit of xg transactions
+REGISTRATION_BATCH_SIZE = 5
+MAX_LEASED_TASKS = 100
+LEASE_SECONDS = 60
+MAX_LEASES_PER_RUN = 20
+WORKER_DELAY = 5            # seconds between two worker runs
+
+
+def queueRegistration(prof, websafeConferenceKey):
+    """Queue the registration of prof, returning its RegistrationTicket."""
+    ticket = RegistrationTicket(
+        userId=prof.key.id(),
+        websafeConferenceKey=websafeConferenceKey,
+        status=str(RegistrationStatus.PENDING),
+    )
+    ticket.put()
+
+    payload = json.dumps({'ticket': ticket.key.urlsafe(),
+                          'userId': prof.key.id()})
+    taskqueue.Queue(REGISTRATION_QUEUE).add(
+        taskqueue.Task(payload=payload, method='PULL', tag=websafeConferenceKey))
+    scheduleWorker()
+    return ticket
+
+
+def scheduleWorker(countdown=WORKER_DELAY):
+    """Enqueue the process_registrations task, at most once per WORKER_DELAY."""
+    # named tasks are deduplicated by the task queue
+    name = 'process-registrations-%d' % int(time.time() / WORKER_DELAY)
+    try:
+        taskqueue.add(name=name, countdown=countdown,
+            url='/tasks/process_registrations'
+        )
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def processRegistrations():
+    """Lease queued registrations and apply them; used by the
+    process_registrations task and cron. Returns the number processed.
+    """
+    queue = taskqueue.Queue(REGISTRATION_QUEUE)
+    processed = 0
+    for _ in range(MAX_LEASES_PER_RUN):
+        # leases the requests sharing the tag of the oldest one,
+        # i.e. requests for the same conference
+        tasks = queue.lease_tasks_by_tag(LEASE_SECONDS, MAX_LEASED_TASKS)
+        if not tasks:
+            return processed
+        wsck = tasks[0].tag
+        # read once, outside of the transactions (see _applyRegistrations())
+        conf = ndb.Key(urlsafe=wsck).get()
+        for i in range(0, len(tasks), REGISTRATION_BATCH_SIZE):
+            batch = tasks[i:i + REGISTRATION_BATCH_SIZE]
+            requests = [json.loads(task.payload) for task in batch]
+            results = _applyRegistrations(wsck, conf, requests)
+            _storeResults(results)
+            queue.delete_tasks(batch)
+            processed += len(batch)
+
+    # more requests are waiting; keep going in a new task
+    scheduleWorker(countdown=0)
+    return processed
+
+
+@ndb.transactional(xg=True)
+def _applyRegistrations(wsck, conf, requests):
+    """Register a batch of users for one conference (conf, read by the
+    caller) in one transaction, returning {ticket: (status, message)}.
+
+    Seats are taken from the seat shards, so the Conference entity group
+    only joins the transaction for conferences without shards.
+    """
+    conf_key = ndb.Key(urlsafe=wsck)
+    if conf and not conf.seatShards:
+        conf = conf_key.get()
+    if not conf:
+        return dict((req['ticket'], (RegistrationStatus.REJECTED,
+            'No conference found with key: %s' % wsck)) for req in requests)
+
+    results = {}
+    profiles = {}
+    attending = {}      # user id -> set of the conference keys of the profile
+    for prof in ndb.get_multi([ndb.Key(Profile, req['userId']) for req in requests]):
+        if prof:
+            prof.migrateKeys()
+            profiles[prof.key.id()] = prof
+            attending[prof.key.id()] = set(prof.conferenceKeysToAttend)
+
+    pending = []
+    first = {}
+    duplicates = []
+    for req in requests:
+        prof = profiles.get(req['userId'])
+        if not prof:
+            results[req['ticket']] = (RegistrationStatus.REJECTED,
+                'No profile found for user: %s' % req['userId'])
+        elif req['userId'] in first:
+            # same user queued twice in this batch: share the first outcome
+            duplicates.append((req, first[req['userId']]))
+        elif conf_key in attending[req['userId']]:
+            # also covers retried batches that already committed
+            results[req['ticket']] = (RegistrationStatus.REGISTERED,
+                'You have already registered for this conference')
+        else:
+            first[req['userId']] = req['ticket']
+            pending.append((req, prof))
+
+    taken = reserveSeats(conf, len(pending))
+    # cached forms only hold the seats of conferences without shards
+    if taken and not conf.seatShards:
+        ndb.get_context().call_on_commit(lambda: invalidateConference(wsck))
+    registered = []
+    for i, (req, prof) in enumerate(pending):
+        if i < taken:
+            prof.conferenceKeysToAttend.append(conf_key)
+            registered.append(prof)
+            results[req['ticket']] = (RegistrationStatus.REGISTERED, None)
+        else:
+            results[req['ticket']] = (RegistrationStatus.REJECTED,
+                'There are no seats available.')
+    for req, ticket in duplicates:
+        results[req['ticket']] = results[ticket]
+
+    ndb.put_multi(registered)
+    addAttendees(wsck, [prof.key.id() for prof in registered])
+    return results
+
+
+def _storeResults(results):
+    """Record the outcome of processed requests on their tickets."""
+    keys = [ndb.Key(urlsafe=ticket) for ticket in results]
+    tickets = [ticket for ticket in ndb.get_multi(keys) if ticket]
+    for ticket in tickets:
+        status, message = results[ticket.key.urlsafe()]
+        ticket.status = str(status)
+        ticket.message = message
+    ndb.put_multi(tickets)
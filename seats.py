@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+"""seats.py
+
+Sharded seat counter for Conference registration.
+
+The seats of a Conference are spread over NUM_SEAT_SHARDS root
+ConferenceSeatShard entities, so concurrent registrations write to
+different entity groups instead of all contending on the Conference.
+Conference.seatsAvailable holds the aggregated count; it is refreshed
+by the reconcile_seats task shortly after registrations happen, while
+getSeatsAsync() serves an up-to-date total from memcache. Changes
+that move a conference in or out of the nearly sold out set update it
+(see announcements.py).
+
+"""
+
+import random
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import ConferenceSeatShard
+
+from announcements import crossesThreshold
+from announcements import updateAlmostSoldOut
+
+NUM_SEAT_SHARDS = 10
+MEMCACHE_SEATS_KEY = "SEATS_%s"
+SEATS_CACHE_TIME = 60       # seconds
+RECONCILE_DELAY = 30        # seconds between two reconciliations
+
+
+def _shardKeys(conf):
+    """Return the keys of the seat shards of a Conference."""
+    return _seatShardKeys(conf.key, conf.seatShards)
+
+
+def _seatShardKeys(conf_key, seatShards):
+    """Return the keys of the seatShards seat shards of a conference."""
+    wsck = conf_key.urlsafe()
+    return [ndb.Key(ConferenceSeatShard, '%s-%d' % (wsck, i))
+            for i in range(seatShards)]
+
+
+def _splitSeats(seats, num_shards):
+    """Spread seats as evenly as possible over num_shards."""
+    base, extra = divmod(max(seats or 0, 0), num_shards)
+    return [base + (1 if i < extra else 0) for i in range(num_shards)]
+
+
+def resetShards(conf, seats, put=True):
+    """Set the seats of conf to seats, (re)writing all its shards, and
+    return the shards.
+
+    Turns legacy conferences into sharded ones; when called on an existing
+    conference it must run inside an xg transaction with the Conference.
+    With put=False the caller writes the shards (e.g. with the Conference)
+    and, outside a transaction, calls seatsReset() once they are written.
+    """
+    conf.seatShards = conf.seatShards or NUM_SEAT_SHARDS
+    conf.seatsAvailable = seats
+    shards = [ConferenceSeatShard(key=key, seatsAvailable=value)
+              for key, value in zip(_shardKeys(conf), _splitSeats(seats, conf.seatShards))]
+    if put:
+        ndb.put_multi(shards)
+    if ndb.in_transaction():
+        ndb.get_context().call_on_commit(lambda: seatsReset(conf, seats))
+    elif put:
+        seatsReset(conf, seats)
+    return shards
+
+
+def seatsReset(conf, seats):
+    """Drop the cached seat count of conf and update the announcement,
+    once its shards have been (re)written by resetShards()."""
+    memcache.delete(MEMCACHE_SEATS_KEY % conf.key.urlsafe())
+    updateAlmostSoldOut(conf.key, conf.name, seats)
+
+
+def reserveSeat(conf):
+    """Take one seat of conf, returning False if it is sold out.
+
+    Must run inside the (xg) registration transaction. Shards are tried in
+    random order so concurrent registrations spread over entity groups;
+    conferences without shards fall back to the Conference entity.
+    """
+    if not conf.seatShards:
+        if conf.seatsAvailable <= 0:
+            return False
+        conf.seatsAvailable -= 1
+        conf.put()
+        _onSeatsChanged(conf, -1)
+        return True
+
+    keys = _shardKeys(conf)
+    random.shuffle(keys)
+    for key in keys:
+        shard = key.get()
+        if shard and shard.seatsAvailable > 0:
+            shard.seatsAvailable -= 1
+            shard.put()
+            _onSeatsChanged(conf, -1)
+            return True
+    return False
+
+
+def reserveSeats(conf, count):
+    """Take up to count seats of conf, returning how many were taken.
+
+    Batch variant of reserveSeat() for queued registrations; must run
+    inside an xg transaction.
+    """
+    if not conf.seatShards:
+        taken = min(count, max(conf.seatsAvailable, 0))
+        if taken:
+            conf.seatsAvailable -= taken
+            conf.put()
+            _onSeatsChanged(conf, -taken)
+        return taken
+
+    shards = [shard for shard in ndb.get_multi(_shardKeys(conf)) if shard]
+    random.shuffle(shards)
+    taken = 0
+    changed = []
+    for shard in shards:
+        if taken == count:
+            break
+        n = min(count - taken, shard.seatsAvailable)
+        if n > 0:
+            shard.seatsAvailable -= n
+            taken += n
+            changed.append(shard)
+    ndb.put_multi(changed)
+    if taken:
+        _onSeatsChanged(conf, -taken)
+    return taken
+
+
+def releaseSeat(conf):
+    """Give back one seat of conf; must run inside the registration transaction."""
+    if not conf.seatShards:
+        conf.seatsAvailable += 1
+        conf.put()
+        _onSeatsChanged(conf, 1)
+        return
+
+    key = random.choice(_shardKeys(conf))
+    shard = key.get() or ConferenceSeatShard(key=key)
+    shard.seatsAvailable += 1
+    shard.put()
+    _onSeatsChanged(conf, 1)
+
+
+def _onSeatsChanged(conf, delta):
+    """Once the transaction commits, adjust the cached total, schedule a
+    reconciliation of Conference.seatsAvailable and update the nearly sold
+    out set if the new total crossed its threshold."""
+    def callback():
+        if conf.seatShards:
+            cache_key = MEMCACHE_SEATS_KEY % conf.key.urlsafe()
+            if delta < 0:
+                seats = memcache.decr(cache_key, -delta)
+            else:
+                seats = memcache.incr(cache_key, delta)
+            scheduleReconcile(conf.key)
+        else:
+            seats = conf.seatsAvailable
+        # without a cached total the reconciliation catches up
+        if seats is not None and crossesThreshold(seats, delta):
+            updateAlmostSoldOut(conf.key, conf.name, seats)
+    ndb.get_context().call_on_commit(callback)
+
+
+@ndb.tasklet
+def getSeatsAsync(conf_key, seatShards):
+    """Return the aggregated seats of the seatShards shards of a conference,
+    cached in memcache (where registrations keep it up to date).
+
+    Lookups of several conferences started together share one memcache and
+    one datastore batch.
+    """
+    ctx = ndb.get_context()
+    cache_key = MEMCACHE_SEATS_KEY % conf_key.urlsafe()
+    seats = yield ctx.memcache_get(cache_key)
+    if seats is None:
+        shards = yield ndb.get_multi_async(_seatShardKeys(conf_key, seatShards))
+        seats = sum(shard.seatsAvailable for shard in shards if shard)
+        yield ctx.memcache_add(cache_key, seats, time=SEATS_CACHE_TIME)
+    raise ndb.Return(seats)
+
+
+def scheduleReconcile(conf_key):
+    """Enqueue the reconcile_seats task, at most once per RECONCILE_DELAY."""
+    wsck = conf_key.urlsafe()
+    # named tasks are deduplicated by the task queue
+    name = 'reconcile-seats-%s-%d' % (wsck, int(time.time() / RECONCILE_DELAY))
+    try:
+        taskqueue.add(name=name, countdown=RECONCILE_DELAY,
+            params={'conferenceKey': wsck},
+            url='/tasks/reconcile_seats'
+        )
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def reconcileSeats(websafeConferenceKey):
+    """Copy the sum of the shards onto Conference.seatsAvailable; used by
+    the reconcile_seats task.
+    """
+    conf = ndb.Key(urlsafe=websafeConferenceKey).get()
+    if not conf or not conf.seatShards:
+        return None
+
+    seats = sum(shard.seatsAvailable for shard in ndb.get_multi(_shardKeys(conf)) if shard)
+    _storeSeats(conf.key, seats)
+    memcache.set(MEMCACHE_SEATS_KEY % websafeConferenceKey, seats, time=SEATS_CACHE_TIME)
+    updateAlmostSoldOut(conf.key, conf.name, seats)
+    return seats
+
+
+@ndb.transactional()
+def _storeSeats(conf_key, seats):
+    """Write the aggregated seats on the Conference entity."""
+    conf = conf_key.get()
+    if conf and conf.seatsAvailable != seats:
+        conf.seatsAvailable = seats
+        conf.put()
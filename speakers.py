@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""speakers.py
+
+Speaker directory.
+
+ConfSpeaker entities are keyed by their display name and do not change
+once created, so the speakers known to exist are cached in the instance
+(LocalCache) and in memcache. resolveSpeakers() looks up many names with
+at most one memcache and one datastore batch for the names missing from
+the instance, creating unknown speakers with get_or_insert.
+
+"""
+
+import hashlib
+
+from google.appengine.ext import ndb
+
+from models import ConfSpeaker
+
+from cache import LocalCache
+
+MEMCACHE_SPEAKER_KEY = "SPEAKER_%s"
+SPEAKER_CACHE_TIME = 3600   # seconds
+SPEAKER_LOCAL_SIZE = 1000
+
+_localSpeakers = LocalCache('speaker', size=SPEAKER_LOCAL_SIZE, ttl=SPEAKER_CACHE_TIME)
+
+
+def _cacheKey(name):
+    """Return the memcache key of a speaker (names can be long)."""
+    return MEMCACHE_SPEAKER_KEY % hashlib.sha1(name.encode('utf-8')).hexdigest()
+
+
+@ndb.tasklet
+def resolveSpeakersAsync(names, create=True):
+    """Return {name: display name} for the speakers of names, creating the
+    missing ones unless create is False (then they are left out)."""
+    speakers = {}
+    for name in set(names):
+        displayName = _localSpeakers.get(name)
+        if displayName is not None:
+            speakers[name] = displayName
+    missing = [name for name in set(names) if name not in speakers]
+    if not missing:
+        raise ndb.Return(speakers)
+
+    # the context batches these memcache calls into one RPC
+    ctx = ndb.get_context()
+    cached = yield [ctx.memcache_get(_cacheKey(name)) for name in missing]
+    unknown = []
+    for name, displayName in zip(missing, cached):
+        if displayName is None:
+            unknown.append(name)
+        else:
+            speakers[name] = displayName
+            _localSpeakers.set(name, displayName)
+
+    found = yield ndb.get_multi_async([ndb.Key(ConfSpeaker, name) for name in unknown])
+    if create:
+        created = yield [ConfSpeaker.get_or_insert_async(name, displayName=name)
+                         for name, speaker in zip(unknown, found) if not speaker]
+        found = [speaker for speaker in found if speaker] + created
+    found = [speaker for speaker in found if speaker]
+
+    yield [ctx.memcache_set(_cacheKey(speaker.key.id()), speaker.displayName,
+                            time=SPEAKER_CACHE_TIME) for speaker in found]
+    for speaker in found:
+        speakers[speaker.key.id()] = speaker.displayName
+        _localSpeakers.set(speaker.key.id(), speaker.displayName)
+    raise ndb.Return(speakers)
+
+
+def resolveSpeakers(names, create=True):
+    """Synchronous resolveSpeakersAsync()."""
+    return resolveSpeakersAsync(names, create).get_result()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""base.py
+
+Shared testbed setup for the API tests.
+
+Run the tests from the project directory with the App Engine SDK on the
+path, e.g.
+
+    PYTHONPATH=$SDK python -m unittest discover -s tests -t .
+
+"""
+
+import collections
+import os
+import sys
+import unittest
+
+# let the SDK put its bundled libraries (endpoints, webapp2, ...) on the path
+try:
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+except ImportError:
+    pass
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+import instrumentation
+
+
+class RpcRecorder(object):
+    """Records the API calls made while installed, as (service.call, batch)
+    pairs; calls made while other calls were in flight share a batch."""
+
+    HOOK_NAME = 'test_rpc_recorder'
+
+    def __init__(self):
+        self.calls = []
+        self._inFlight = 0
+        self._batch = 0
+
+    def _preCall(self, service, call, request, response, rpc=None):
+        if not self._inFlight:
+            self._batch += 1
+        self._inFlight += 1
+        self.calls.append((service + '.' + call, self._batch))
+
+    def _postCall(self, service, call, request, response, rpc=None, error=None):
+        self._inFlight -= 1
+
+    def install(self):
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(self.HOOK_NAME, self._preCall)
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(self.HOOK_NAME, self._postCall)
+
+    def names(self, prefix=''):
+        """Return the recorded call names starting with prefix."""
+        return [name for name, _ in self.calls if name.startswith(prefix)]
+
+    def batches(self, prefix=''):
+        """Return the recorded calls starting with prefix, grouped by batch."""
+        batches = {}
+        for name, batch in self.calls:
+            if name.startswith(prefix):
+                batches.setdefault(batch, []).append(name)
+        return [batches[batch] for batch in sorted(batches)]
+
+    def reset(self):
+        self.calls = []
+
+
+class ApiTestCase(unittest.TestCase):
+    """Activates the service stubs used by ConferenceApi and signs in a user."""
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        # fully consistent HRD, so global queries see earlier writes
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=ROOT)
+        self.testbed.init_urlfetch_stub()
+        self.testbed.init_app_identity_stub()
+        self.testbed.init_user_stub()
+        ndb.get_context().clear_cache()
+        ndb.get_context().set_cache_policy(False)
+        # instance caches outlive the testbed datastore and memcache
+        from announcements import _localAnnouncement
+        from speakers import _localSpeakers
+        from utils import _localTokens
+        for localCache in (_localAnnouncement, _localSpeakers, _localTokens):
+            localCache.clear()
+        # the testbed replaces the apiproxy the hook was installed on
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+            instrumentation.HOOK_NAME, instrumentation._postCall)
+        self.login('organizer@example.com')
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def login(self, email):
+        """Make email the user of the following endpoint calls."""
+        self.testbed.setup_env(
+            ENDPOINTS_AUTH_EMAIL=email,
+            ENDPOINTS_AUTH_DOMAIN='example.com',
+            overwrite=True)
+
+    def countRpcs(self, fn, *args):
+        """Call fn(*args), returning its result and the API calls it made
+        ({service.call: count}) as counted by the instrumentation hook."""
+        instrumentation._local.record = record = {
+            'memcacheHits': 0, 'memcacheMisses': 0,
+            'rpcs': collections.defaultdict(int)}
+        try:
+            result = fn(*args)
+        finally:
+            instrumentation._local.record = None
+        return result, dict(record['rpcs'])
+
+    def api(self):
+        """Return a ConferenceApi service, as created for each request."""
+        from conference import ConferenceApi
+        return ConferenceApi()
+
+    def createConference(self, name='PyCon', maxAttendees=10, **fields):
+        """Create a conference as the current user, returning its websafe key."""
+        from models import ConferenceForm
+        form = self.api().createConference(
+            ConferenceForm(name=name, maxAttendees=maxAttendees, **fields))
+        return form.websafeKey
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""test_announcements.py
+
+Tests of the incrementally maintained nearly sold out announcement: seat
+changes committed by registrations and updateConference must move the
+conference in and out of the set.
+
+"""
+
+import unittest
+
+from tests.base import ApiTestCase
+
+from google.appengine.ext import ndb
+
+
+class AlmostSoldOutTest(ApiTestCase):
+
+    def setUp(self):
+        super(AlmostSoldOutTest, self).setUp()
+        # ALMOST_SOLD_OUT_SEATS (5) + 2 seats
+        self.wsck = self.createConference(name='PyCon', maxAttendees=7)
+        # registrations keep the cached seat total, which getConference loads
+        self.api().getConference(self.request())
+
+    def request(self, **fields):
+        from conference import CONF_GET_REQUEST, CONF_POST_REQUEST
+        if fields:
+            return CONF_POST_REQUEST.combined_message_class(
+                websafeConferenceKey=self.wsck, **fields)
+        return CONF_GET_REQUEST.combined_message_class(websafeConferenceKey=self.wsck)
+
+    def isAnnounced(self):
+        """Return whether the conference is in the nearly sold out set, and
+        check the announcement served agrees."""
+        from announcements import _almostSoldOutKey, getAnnouncement
+        entity = _almostSoldOutKey().get()
+        announced = bool(entity) and ndb.Key(urlsafe=self.wsck) in entity.conferenceKeys
+        self.assertEqual('PyCon' in getAnnouncement(), announced)
+        return announced
+
+    def register(self, email, reg=True):
+        self.login(email)
+        api = self.api()
+        if reg:
+            self.assertTrue(api.registerForConference(self.request()).data)
+        else:
+            self.assertTrue(api.unregisterFromConference(self.request()).data)
+
+    def testRegistrationsCrossThreshold(self):
+        self.register('user0@example.com')
+        self.assertFalse(self.isAnnounced())
+        # 5 seats left: in
+        self.register('user1@example.com')
+        self.assertTrue(self.isAnnounced())
+        # 6 seats left: out again
+        self.register('user1@example.com', reg=False)
+        self.assertFalse(self.isAnnounced())
+
+    def testUpdateConferenceSeats(self):
+        form = self.api().updateConference(self.request(seatsAvailable=3))
+        self.assertEqual(form.seatsAvailable, 3)
+        self.assertTrue(self.isAnnounced())
+        self.assertEqual(self.api().getConference(self.request()).seatsAvailable, 3)
+
+        self.api().updateConference(self.request(seatsAvailable=10))
+        self.assertFalse(self.isAnnounced())
+
+        # sold out conferences are not announced either
+        self.api().updateConference(self.request(seatsAvailable=0))
+        self.assertFalse(self.isAnnounced())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""test_rpcs.py
+
+RPC cost of the API endpoints: listings must make a fixed set of
+datastore calls (one query, one batched get) however many results they
+return, and independent RPCs of a handler must be in flight together.
+
+"""
+
+import unittest
+
+from tests.base import ApiTestCase
+from tests.base import RpcRecorder
+
+# both sizes fit in the first batch of a query (20 results), so no query
+# continuation (datastore_v3.Next) is expected
+FEW = 2
+MANY = 12
+
+
+def datastoreCalls(rpcs):
+    """Return the datastore calls of an rpcs dict."""
+    return dict((name, count) for name, count in rpcs.items()
+                if name.startswith('datastore_v3.'))
+
+
+class SessionListingRpcsTest(ApiTestCase):
+
+    def setUp(self):
+        super(SessionListingRpcsTest, self).setUp()
+        self.wsck = self.createConference()
+        self.sessionKeys = []
+
+    def addSessions(self, total):
+        """Create sessions (of one speaker) until the conference has total."""
+        from conference import SESSIONS_POST_REQUEST
+        from models import ConfSessionForm
+        from models import ConfSessionType
+        count = total - len(self.sessionKeys)
+        request = SESSIONS_POST_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck,
+            items=[ConfSessionForm(name='Session %d' % (len(self.sessionKeys) + i),
+                                   speakerDisplayName='Guido',
+                                   typeOfSession=ConfSessionType.LECTURE)
+                   for i in range(count)])
+        forms = self.api().createSessions(request)
+        self.sessionKeys.extend(form.websafeKey for form in forms.items)
+
+    def assertRpcs(self, call, expected, prepare=lambda: None):
+        """call() lists the sessions; for FEW sessions as for MANY it must
+        make exactly the expected datastore calls ({service.call: count}).
+        prepare() runs (uncounted) after the sessions are created."""
+        for total in (FEW, MANY):
+            self.addSessions(total)
+            prepare()
+            forms, rpcs = self.countRpcs(call)
+            self.assertEqual(len(forms.items), total)
+            self.assertEqual(datastoreCalls(rpcs), expected)
+
+    def testGetConferenceSessions(self):
+        from conference import CONF_GET_REQUEST
+        request = CONF_GET_REQUEST.combined_message_class(websafeConferenceKey=self.wsck)
+        # the session query and the conference get
+        self.assertRpcs(lambda: self.api().getConferenceSessions(request),
+                        {'datastore_v3.RunQuery': 1, 'datastore_v3.Get': 1})
+
+    def testGetConferenceSessionsByType(self):
+        from conference import SESSBYTPE_GET_REQUEST
+        from models import ConfSessionType
+        request = SESSBYTPE_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck, typeOfSession=ConfSessionType.LECTURE)
+        # the session query and the conference get
+        self.assertRpcs(lambda: self.api().getConferenceSessionsByType(request),
+                        {'datastore_v3.RunQuery': 1, 'datastore_v3.Get': 1})
+
+    def testGetSessionsBySpeaker(self):
+        from conference import SESSBYSPEAKER_GET_REQUEST
+        request = SESSBYSPEAKER_GET_REQUEST.combined_message_class(speakerDisplayName='Guido')
+        # the keys-only speaker index query and one get_multi of the
+        # sessions (the speaker itself is known to the instance)
+        self.assertRpcs(lambda: self.api().getSessionsBySpeaker(request),
+                        {'datastore_v3.RunQuery': 1, 'datastore_v3.Get': 1})
+
+    def testGetSessionsInWishlist(self):
+        from protorpc.message_types import VoidMessage
+        from models import WishlistUpdateForm
+        # the Profile get and one get_multi of the sessions
+        self.assertRpcs(
+            lambda: self.api().getSessionsInWishlist(VoidMessage()),
+            {'datastore_v3.Get': 2},
+            lambda: self.api().updateWishlist(WishlistUpdateForm(add=self.sessionKeys)))
+
+
+class ParallelRpcsTest(ApiTestCase):
+
+    def setUp(self):
+        super(ParallelRpcsTest, self).setUp()
+        self.recorder = RpcRecorder()
+        self.recorder.install()
+
+    def assertOverlap(self, *names):
+        """Some batch of the recorded calls holds all of names."""
+        batches = self.recorder.batches()
+        self.assertTrue(any(set(names).issubset(batch) for batch in batches),
+                        '%s not in flight together: %s' % (', '.join(names), batches))
+
+    def testCreateConference(self):
+        # the organizer Profile is read while the Conference id is allocated
+        self.createConference()
+        self.assertOverlap('datastore_v3.AllocateIds', 'datastore_v3.Get')
+
+    def testCreateSession(self):
+        # the Conference is read while the Session id is allocated
+        from conference import SESS_POST_REQUEST
+        wsck = self.createConference()
+        self.recorder.reset()
+        self.api().createSession(SESS_POST_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck, name='Keynote', speakerDisplayName='Guido'))
+        self.assertOverlap('datastore_v3.AllocateIds', 'datastore_v3.Get')
+
+    def testGetConferenceSessions(self):
+        # the sessions are queried while the Conference is read
+        from conference import CONF_GET_REQUEST
+        wsck = self.createConference()
+        self.recorder.reset()
+        self.api().getConferenceSessions(
+            CONF_GET_REQUEST.combined_message_class(websafeConferenceKey=wsck))
+        self.assertOverlap('datastore_v3.RunQuery', 'datastore_v3.Get')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""test_seats.py
+
+Load tests of the sharded seat counter: many registrations against one
+conference must never oversell it, and the shards must keep matching the
+attendee index.
+
+"""
+
+import random
+import threading
+import unittest
+
+from tests.base import ApiTestCase
+
+from google.appengine.ext import ndb
+
+SEATS = 20
+USERS = 50
+
+
+class SeatShardsTest(ApiTestCase):
+
+    def setUp(self):
+        super(SeatShardsTest, self).setUp()
+        self.wsck = self.createConference(maxAttendees=SEATS)
+        self.emails = ['user%d@example.com' % i for i in range(USERS)]
+
+    def request(self):
+        from conference import CONF_GET_REQUEST
+        return CONF_GET_REQUEST.combined_message_class(websafeConferenceKey=self.wsck)
+
+    def assertShardsConsistent(self):
+        """The shards are never negative and sum to the free seats."""
+        from attendees import getAttendeeIds
+        from seats import _shardKeys
+        conf = ndb.Key(urlsafe=self.wsck).get()
+        shards = ndb.get_multi(_shardKeys(conf))
+        for shard in shards:
+            self.assertGreaterEqual(shard.seatsAvailable, 0)
+        seats = sum(shard.seatsAvailable for shard in shards)
+        self.assertEqual(seats, SEATS - len(getAttendeeIds(self.wsck)))
+        return seats
+
+    def apisFor(self, emails):
+        """Return a ConferenceApi per user of emails, its user resolved now:
+        the current user comes from os.environ, which threads share."""
+        apis = []
+        for email in emails:
+            self.login(email)
+            api = self.api()
+            api._context().userId
+            apis.append(api)
+        return apis
+
+    def runConcurrently(self, calls):
+        """Run the calls, each in its own thread (and ndb context), all
+        released at once; return their results and the errors raised
+        other than ConflictException (no seats left)."""
+        from models import ConflictException
+        start = threading.Event()
+        results = [None] * len(calls)
+        errors = []
+
+        def run(i, call):
+            start.wait()
+            try:
+                results[i] = call()
+            except ConflictException:
+                results[i] = False
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i, call))
+                   for i, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def testConcurrentRegistrations(self):
+        apis = self.apisFor(self.emails)
+        results, errors = self.runConcurrently(
+            [lambda api=api: api.registerForConference(self.request()).data
+             for api in apis])
+        # no contention error, no seat oversold, no seat left unsold
+        self.assertEqual(errors, [])
+        self.assertEqual(results.count(True), SEATS)
+        self.assertEqual(self.assertShardsConsistent(), 0)
+
+        # the registered users leave while the others try again
+        registered = [api for api, result in zip(apis, results) if result]
+        rejected = [api for api, result in zip(apis, results) if not result]
+        results, errors = self.runConcurrently(
+            [lambda api=api: api.unregisterFromConference(self.request()).data
+             for api in registered] +
+            [lambda api=api: api.registerForConference(self.request()).data
+             for api in rejected])
+        self.assertEqual(errors, [])
+        self.assertTrue(all(results[:len(registered)]))
+        registrations = results[len(registered):].count(True)
+        self.assertLessEqual(registrations, SEATS)
+        self.assertEqual(self.assertShardsConsistent(), SEATS - registrations)
+
+    def testRegisterAndUnregister(self):
+        from models import ConflictException
+        registered = set()
+        random.seed(4)
+        for _ in range(4 * USERS):
+            email = random.choice(self.emails)
+            self.login(email)
+            api = self.api()
+            if email in registered and random.random() < 0.3:
+                self.assertTrue(api.unregisterFromConference(self.request()).data)
+                registered.remove(email)
+            elif email not in registered:
+                try:
+                    self.assertTrue(api.registerForConference(self.request()).data)
+                    registered.add(email)
+                except ConflictException:
+                    self.assertEqual(len(registered), SEATS)
+            self.assertShardsConsistent()
+        self.assertEqual(self.assertShardsConsistent(), SEATS - len(registered))
+
+    def testQueuedRegistrationBurst(self):
+        from registrations import processRegistrations
+        for email in self.emails:
+            self.login(email)
+            self.api().queueRegistrationForConference(self.request())
+        self.assertEqual(processRegistrations(), USERS)
+        self.assertEqual(self.assertShardsConsistent(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
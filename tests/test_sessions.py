@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+"""test_sessions.py
+
+End-to-end tests of the session endpoints.
+
+"""
+
+import unittest
+
+from tests.base import ApiTestCase
+
+from google.appengine.ext import ndb
+
+
+class CreateSessionTest(ApiTestCase):
+
+    def createSession(self, wsck, **fields):
+        from conference import SESS_POST_REQUEST
+        request = SESS_POST_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck, **fields)
+        return self.api().createSession(request)
+
+    def testCreateSession(self):
+        from models import ConfSession, ConfSpeaker, SpeakerSession
+        wsck = self.createConference()
+
+        form = self.createSession(wsck, name='Keynote',
+                                  speakerDisplayName='Guido',
+                                  start_time='09:00', date='2015-06-01')
+
+        self.assertEqual(form.name, 'Keynote')
+        self.assertEqual(form.speakerDisplayName, 'Guido')
+        self.assertTrue(form.websafeKey)
+
+        sess = ndb.Key(urlsafe=form.websafeKey).get()
+        self.assertIsInstance(sess, ConfSession)
+        self.assertEqual(sess.key.parent().urlsafe(), wsck)
+        self.assertEqual(sess.speakerId, 'Guido')
+        self.assertEqual(sess.speakerDisplayName, 'Guido')
+        self.assertIsNotNone(ndb.Key(ConfSpeaker, 'Guido').get())
+        index = SpeakerSession.query(ancestor=ndb.Key(ConfSpeaker, 'Guido')).fetch()
+        self.assertEqual([entry.key.id() for entry in index], [sess.key.urlsafe()])
+
+    def testCreateSessionOfOtherOrganizer(self):
+        import endpoints
+        wsck = self.createConference()
+        self.login('someone@example.com')
+        self.assertRaises(endpoints.UnauthorizedException, self.createSession,
+                          wsck, name='Keynote', speakerDisplayName='Guido')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""test_tokens.py
+
+Tests of the OAuth token cache of utils.getUserId(), against a stand-in
+tokeninfo service registered as the urlfetch stub.
+
+"""
+
+import hashlib
+import json
+import time
+import unittest
+import urlparse
+
+from tests.base import ApiTestCase
+
+from google.appengine.api import apiproxy_stub
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+
+class TokenInfoStub(apiproxy_stub.APIProxyStub):
+    """urlfetch stub answering tokeninfo requests from a dict of
+    {token: (user id, expires_in)}; other tokens are invalid."""
+
+    def __init__(self, tokens):
+        super(TokenInfoStub, self).__init__('urlfetch')
+        self.tokens = tokens
+        self.fetches = []
+
+    def _Dynamic_Fetch(self, request, response):
+        query = urlparse.parse_qs(urlparse.urlparse(request.url()).query)
+        token_type, token = query.items()[0]
+        self.fetches.append((token_type, token[0]))
+        if token[0] in self.tokens:
+            user_id, expires_in = self.tokens[token[0]]
+            response.set_statuscode(200)
+            response.set_content(json.dumps({'user_id': user_id, 'expires_in': expires_in}))
+        else:
+            response.set_statuscode(400)
+            response.set_content(json.dumps({'error': 'invalid_token'}))
+
+
+class TokenCacheTest(ApiTestCase):
+
+    def setUp(self):
+        super(TokenCacheTest, self).setUp()
+        self.tokeninfo = TokenInfoStub({'good': ('12345', 3600), 'short': ('678', 1)})
+        apiproxy_stub_map.apiproxy.ReplaceStub('urlfetch', self.tokeninfo)
+        self.forgetInstance()
+
+    def forgetInstance(self):
+        """Drop the tokens cached in the instance, as on a new instance."""
+        from utils import _localTokens
+        _localTokens.clear()
+
+    def userId(self, token):
+        from utils import getUserId
+        self.testbed.setup_env(HTTP_AUTHORIZATION='Bearer ' + token,
+                               OAUTH_USER_ID='1', overwrite=True)
+        return getUserId(None, id_type='oauth')
+
+    def cacheKey(self, token):
+        from utils import MEMCACHE_TOKEN_KEY
+        return MEMCACHE_TOKEN_KEY % hashlib.sha256(token).hexdigest()
+
+    def testValidTokenIsCached(self):
+        self.assertEqual(self.userId('good'), '12345')
+        self.assertEqual(self.userId('good'), '12345')
+        self.assertEqual(len(self.tokeninfo.fetches), 1)
+
+        # another instance finds it in memcache
+        self.forgetInstance()
+        self.assertEqual(self.userId('good'), '12345')
+        self.assertEqual(len(self.tokeninfo.fetches), 1)
+
+    def testCacheKeyIsTokenHash(self):
+        from utils import TOKEN_CACHE_TIME
+        self.userId('good')
+        user_id, expires = memcache.get(self.cacheKey('good'))
+        self.assertEqual(user_id, '12345')
+        # capped at TOKEN_CACHE_TIME although the token lives longer
+        self.assertAlmostEqual(expires, time.time() + TOKEN_CACHE_TIME, delta=5)
+        self.assertIsNone(memcache.get('TOKEN_USER_good'))
+
+    def testInvalidTokenIsCachedBriefly(self):
+        from utils import INVALID_TOKEN_CACHE_TIME
+        self.assertEqual(self.userId('bad'), '')
+        self.assertEqual(self.userId('bad'), '')
+        self.assertEqual(self.tokeninfo.fetches, [('access_token', 'bad')])
+
+        user_id, expires = memcache.get(self.cacheKey('bad'))
+        self.assertEqual(user_id, '')
+        self.assertAlmostEqual(expires, time.time() + INVALID_TOKEN_CACHE_TIME, delta=5)
+
+    def testTokenExpires(self):
+        self.assertEqual(self.userId('short'), '678')
+        self.assertEqual(self.userId('short'), '678')
+        self.assertEqual(len(self.tokeninfo.fetches), 1)
+
+        # expires_in bounds both caches
+        time.sleep(2)
+        self.assertIsNone(memcache.get(self.cacheKey('short')))
+        self.assertEqual(self.userId('short'), '678')
+        self.assertEqual(len(self.tokeninfo.fetches), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,38 +1,95 @@
+import hashlib
 import json
 import os
 import time
 import uuid
 
-from google.appengine.api import urlfetch
+from google.appengine.ext import ndb
 from models import Profile
 
-def getUserId(user, id_type="email"):
-    if id_type == "email":
-        return user.email()
+from cache import LocalCache
+
+# point it at a stand-in tokeninfo service to run without Google accounts
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
+TOKENINFO_RETRIES = 3
+# token -> user id cache, keyed by a hash of the token
+MEMCACHE_TOKEN_KEY = "TOKEN_USER_%s"
+TOKEN_CACHE_TIME = 600          # seconds; never beyond the token expiry
+INVALID_TOKEN_CACHE_TIME = 60   # seconds invalid tokens are remembered
+
+_localTokens = LocalCache('token', size=1000, ttl=TOKEN_CACHE_TIME)
+
+
+@ndb.tasklet
+def _fetchTokenInfoAsync(token, token_type):
+    """Return (user id, seconds it may be cached) from the tokeninfo
+    endpoint; the user id is '' for invalid tokens and None if the
+    endpoint kept failing."""
+    ctx = ndb.get_context()
+    wait = 1
+    for i in range(TOKENINFO_RETRIES):
+        resp = yield ctx.urlfetch(TOKENINFO_URL % (token_type, token))
+        if resp.status_code == 200:
+            info = json.loads(resp.content)
+            ttl = min(int(info.get('expires_in') or TOKEN_CACHE_TIME), TOKEN_CACHE_TIME)
+            raise ndb.Return(info.get('user_id', ''), ttl)
+        elif resp.status_code == 400 and 'invalid_token' in resp.content:
+            if token_type == 'access_token':
+                raise ndb.Return('', INVALID_TOKEN_CACHE_TIME)
+            token_type = 'access_token'
+        else:
+            yield ndb.sleep(wait)
+            wait = wait + i
+    raise ndb.Return(None, 0)
+
+
+@ndb.tasklet
+def _getOAuthUserIdAsync(token, token_type):
+    """Return the user id of an OAuth token ('' if it is invalid), cached
+    in the instance and in memcache until the token expires."""
+    cache_key = MEMCACHE_TOKEN_KEY % hashlib.sha256(token).hexdigest()
+    user_id = _localTokens.get(cache_key)
+    if user_id is not None:
+        raise ndb.Return(user_id)
 
+    ctx = ndb.get_context()
+    cached = yield ctx.memcache_get(cache_key)
+    if cached is not None:
+        user_id, expires = cached
+    else:
+        user_id, ttl = yield _fetchTokenInfoAsync(token, token_type)
+        if user_id is None:
+            # tokeninfo is failing, not the token: do not remember it
+            raise ndb.Return('')
+        expires = time.time() + ttl
+        if ttl > 0:
+            # (memcache treats a time of 0 as "never expires")
+            yield ctx.memcache_set(cache_key, (user_id, expires), time=ttl)
+    _localTokens.set(cache_key, user_id, ttl=max(expires - time.time(), 0))
+    raise ndb.Return(user_id)
+
+
+@ndb.tasklet
+def getUserIdAsync(user, id_type="email"):
+    """Asynchronous getUserId(); only the oauth id type makes RPCs."""
     if id_type == "oauth":
-        """A workaround implementation for getting userid."""
         auth = os.getenv('HTTP_AUTHORIZATION')
         bearer, token = auth.split()
         token_type = 'id_token'
         if 'OAUTH_USER_ID' in os.environ:
             token_type = 'access_token'
-        url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-               % (token_type, token))
-        user = {}
-        wait = 1
-        for i in range(3):
-            resp = urlfetch.fetch(url)
-            if resp.status_code == 200:
-                user = json.loads(resp.content)
-                break
-            elif resp.status_code == 400 and 'invalid_token' in resp.content:
-                url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                       % ('access_token', token))
-            else:
-                time.sleep(wait)
-                wait = wait + i
-        return user.get('user_id', '')
+        user_id = yield _getOAuthUserIdAsync(token, token_type)
+        raise ndb.Return(user_id)
+    raise ndb.Return(getUserId(user, id_type))
+
+
+def getUserId(user, id_type="email"):
+    if id_type == "email":
+        return user.email()
+
+    if id_type == "oauth":
+        """A workaround implementation for getting userid."""
+        return getUserIdAsync(user, id_type).get_result()
 
     if id_type == "custom":
         # implement your own user_id creation and getting algorythm